@@ -0,0 +1,67 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+import data_manager as dm
+
+# --- Settings ---
+ANNOUNCEMENTS_FILE = os.path.join(dm.STATE_DIR, "announcements.json")
+# Local hour of the day (0-23) at which birthday greetings are posted.
+BIRTHDAY_ANNOUNCE_HOUR = int(os.getenv("BIRTHDAY_ANNOUNCE_HOUR", "9"))
+# Longest single sleep (seconds), so clock changes are noticed within the hour.
+ANNOUNCE_MAX_SLEEP = 3600
+
+# --- Birthday Announcer ---
+
+class BirthdayAnnouncer:
+    """
+    Posts birthday greetings once a day. It sleeps until the announcement hour,
+    asks data_manager for today's birthdays (an indexed month-day lookup), and
+    records the date it last announced so a restart never greets twice.
+    `announce` receives the list of (user_id, bday) pairs.
+    """
+
+    def __init__(self, announce, hour=BIRTHDAY_ANNOUNCE_HOUR, path=ANNOUNCEMENTS_FILE):
+        self.announce = announce
+        self.hour = hour
+        self.path = path
+        self.last_announced = dm.load_json(path, {}).get("birthdays") if path else None
+        self._thread = None
+
+    def next_run(self, now=None):
+        """Returns when the next announcement is due."""
+        now = now or datetime.now()
+        run_at = now.replace(hour=self.hour, minute=0, second=0, microsecond=0)
+        if self.last_announced == now.date().isoformat():
+            run_at += timedelta(days=1)
+        return run_at
+
+    def run_due(self, now=None):
+        """Announces today's birthdays if the hour has come and they weren't announced yet. Returns them."""
+        now = now or datetime.now()
+        if now < self.next_run(now):
+            return []
+        birthdays = dm.get_birthdays_on(now.date())
+        if birthdays:
+            self.announce(birthdays)
+        self.last_announced = now.date().isoformat()
+        if self.path:
+            dm.save_json(self.path, {"birthdays": self.last_announced})
+        return birthdays
+
+    def start(self):
+        """Runs the announcer on a daemon thread."""
+        if self._thread is not None:
+            return
+
+        def loop():
+            while True:
+                try:
+                    self.run_due()
+                except Exception as e:
+                    print(f"Error announcing birthdays: {e}")
+                delay = (self.next_run() - datetime.now()).total_seconds()
+                time.sleep(min(max(delay, 60), ANNOUNCE_MAX_SLEEP))
+
+        self._thread = threading.Thread(target=loop, daemon=True)
+        self._thread.start()
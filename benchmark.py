@@ -0,0 +1,196 @@
+# Replays synthetic chat traffic against the bot using the offline fake client
+# and reports throughput, reply latency, API calls per command and memory growth.
+#
+#   python benchmark.py --users 50 --groups 3 --rate 20 --duration 30
+#
+# The bot runs in a scratch directory (only 'lists' is shared with the repo),
+# so scores, decks and caches written during a run never touch 'data/'.
+import argparse
+import atexit
+import contextlib
+import io
+import json
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Roughly how often each command shows up in a busy group chat.
+DEFAULT_MIX = {
+    "!truth": 20, "!dare": 15, "!nhie": 10, "!roast": 8, "!trivia": 10,
+    "!answer": 15, "!8ball": 8, "!pick": 4, "!ship": 3, "!leaderboard": 3,
+    "!birthdays": 1, "!files": 1, "!help": 2,
+}
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load-replay benchmark for the chat bot.")
+    parser.add_argument("--users", type=int, default=50, help="Simulated chat members in total.")
+    parser.add_argument("--groups", type=int, default=3, help="Group chats served by the bot.")
+    parser.add_argument("--rate", type=float, default=10.0, help="Commands per second, across all groups.")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of traffic to generate.")
+    parser.add_argument("--drain", type=float, default=30.0, help="Seconds to wait for outstanding replies.")
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated API latency per call (s).")
+    parser.add_argument("--jitter", type=float, default=0.05, help="Extra random API latency (s).")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability of an injected API error.")
+    parser.add_argument("--mix", type=str, default=None, help='Command weights as JSON, e.g. \'{"!truth": 3, "!trivia": 1}\'.')
+    parser.add_argument("--poll-interval", type=float, default=None, help="Override POLL_MIN_INTERVAL.")
+    parser.add_argument("--pacing", action="store_true", help="Keep the configured outbox pacing (disabled by default).")
+    parser.add_argument("--rate-limit", action="store_true", help="Keep the inbound rate limit (disabled by default).")
+    parser.add_argument("--trace-memory", action="store_true", help="Measure Python heap growth with tracemalloc (slower).")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+    return parser.parse_args(argv)
+
+def prepare_environment(args):
+    """Moves into a scratch directory and sets the bot's settings before it is imported."""
+    workdir = tempfile.mkdtemp(prefix="gcbot-bench-")
+    os.symlink(os.path.join(REPO_DIR, "lists"), os.path.join(workdir, "lists"))
+    os.makedirs(os.path.join(workdir, "data"))
+    # Registered before the bot is imported, so it runs after the bot's own exit flush
+    atexit.register(shutil.rmtree, workdir, True)
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_DIR)
+
+    if args.poll_interval is not None:
+        os.environ["POLL_MIN_INTERVAL"] = str(args.poll_interval)
+    if not args.pacing:
+        for name in ("OUTBOX_RATE", "OUTBOX_BURST", "OUTBOX_GLOBAL_RATE", "OUTBOX_GLOBAL_BURST"):
+            os.environ[name] = "1000000"
+    if not args.rate_limit:
+        os.environ["RATE_LIMIT_COMMANDS"] = "1000000"
+    return workdir
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def max_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def run(args):
+    prepare_environment(args)
+    rng = random.Random(args.seed)
+    mix = json.loads(args.mix) if args.mix else DEFAULT_MIX
+    commands, weights = list(mix), list(mix.values())
+
+    from fake_instagram import FakeInstagramClient
+    import bot
+
+    client = FakeInstagramClient(latency=args.latency, jitter=args.jitter,
+                                 error_rate=args.error_rate, seed=args.seed)
+    group_ids = [str(100 + i) for i in range(args.groups)]
+    user_ids = [str(1000 + i) for i in range(args.users)]
+    members = {}
+    for index, group_id in enumerate(group_ids):
+        # Every user is in at least one group; groups overlap like real friend circles
+        members[group_id] = [uid for i, uid in enumerate(user_ids) if i % args.groups == index or rng.random() < 0.2]
+        client.add_thread(group_id, [client.bot_user_id] + members[group_id])
+
+    posted_at = {}  # { message_id: monotonic time posted }
+    latencies = []
+    lock = threading.Lock()
+
+    bot.start_workers(client)
+    log_sent = bot.outbox.on_sent
+
+    def record_sent(thread_id, text, label, sources):
+        now = time.monotonic()
+        with lock:
+            for source in sources:
+                if source in posted_at:
+                    latencies.append(now - posted_at.pop(source))
+        log_sent(thread_id, text, label, sources)
+
+    bot.outbox.on_sent = record_sent
+
+    bot_output = io.StringIO()
+    with contextlib.redirect_stdout(bot_output):
+        listener = threading.Thread(target=bot.listen_to_groups, args=(client, group_ids), daemon=True)
+        listener.start()
+        time.sleep(0.5)  # Let the listener seed every chat
+
+        if args.trace_memory:
+            tracemalloc.start()
+        rss_before = max_rss_kb()
+        calls_before = client.api_calls()
+        endpoint_calls_before = dict(client.calls)
+
+        posted = 0
+        started = time.monotonic()
+        next_at = started
+        while time.monotonic() - started < args.duration:
+            next_at += rng.expovariate(args.rate)
+            delay = next_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            group_id = rng.choice(group_ids)
+            cmd = rng.choices(commands, weights)[0]
+            text = f"{cmd} {rng.choice('abcd')}" if cmd == "!answer" else cmd
+            message = client.post_message(group_id, rng.choice(members[group_id]), text)
+            with lock:
+                posted_at[message.id] = time.monotonic()
+            posted += 1
+        traffic_elapsed = time.monotonic() - started
+
+        drain_deadline = time.monotonic() + args.drain
+        while time.monotonic() < drain_deadline:
+            with lock:
+                if not posted_at:
+                    break
+            time.sleep(0.1)
+        elapsed = time.monotonic() - started
+
+        heap_growth = None
+        if args.trace_memory:
+            heap_growth, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        rss_after = max_rss_kb()
+
+    answered = len(latencies)
+    api_calls = client.api_calls() - calls_before
+    endpoint_calls = {name: count - endpoint_calls_before.get(name, 0) for name, count in client.calls.items()}
+    return {
+        "users": args.users,
+        "groups": args.groups,
+        "commands_posted": posted,
+        "commands_answered": answered,
+        "unanswered": posted - answered,
+        "traffic_seconds": round(traffic_elapsed, 2),
+        "commands_per_sec": round(answered / elapsed, 2) if elapsed else 0,
+        "latency_p50_ms": round(percentile(latencies, 50) * 1000, 1) if latencies else None,
+        "latency_p99_ms": round(percentile(latencies, 99) * 1000, 1) if latencies else None,
+        "api_calls": api_calls,
+        "api_calls_per_command": round(api_calls / posted, 2) if posted else None,
+        "api_calls_by_endpoint": endpoint_calls,
+        "messages_sent": endpoint_calls.get("direct_send", 0),
+        "max_rss_growth_kb": rss_after - rss_before,
+        "heap_growth_kb": round(heap_growth / 1024, 1) if heap_growth is not None else None,
+    }
+
+def print_report(report):
+    print("--- Benchmark Report ---")
+    for key, value in report.items():
+        if isinstance(value, dict):
+            value = ", ".join(f"{name}={count}" for name, count in sorted(value.items()))
+        print(f"{key:>24}: {value}")
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run(args)
+    if args.json:
+        print(json.dumps(report, indent=4))
+    else:
+        print_report(report)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import bisect
+from datetime import date, datetime
+
+# --- Month-Day Keys ---
+
+def month_day_key(bday_str):
+    """Converts a 'dd-mm' birthday into a sortable 'mm-dd' key, or None if it is invalid."""
+    try:
+        # Parsed in a leap year so 29-02 is accepted
+        return datetime.strptime(f"{bday_str}-2000", '%d-%m-%Y').strftime('%m-%d')
+    except (TypeError, ValueError):
+        return None
+
+def keys_for_day(day=None):
+    """Month-day keys whose birthdays are celebrated on `day`; 29-02 falls on 28-02 outside leap years."""
+    day = day or date.today()
+    keys = [day.strftime('%m-%d')]
+    if keys[0] == "02-28" and not _is_leap(day.year):
+        keys.append("02-29")
+    return keys
+
+def days_until(bday_str, today=None):
+    """Days from `today` until the next occurrence of a 'dd-mm' birthday (0 if it is today)."""
+    today = today or date.today()
+    key = month_day_key(bday_str)
+    if key is None:
+        return None
+    for year in (today.year, today.year + 1, today.year + 2):
+        month, day = int(key[:2]), int(key[3:])
+        if (month, day) == (2, 29) and not _is_leap(year):
+            day = 28
+        next_bday = date(year, month, day)
+        if next_bday >= today:
+            return (next_bday - today).days
+    return None
+
+def _is_leap(year):
+    return year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
+
+# --- Calendar Index ---
+
+class BirthdayCalendar:
+    """
+    Birthdays kept in a list sorted by month-day, updated as they are set, so
+    "the next N from today" is a bisect plus a slice that wraps around the end
+    of the year. Entries that aren't valid dates are kept but never listed as
+    upcoming.
+    """
+
+    def __init__(self, birthdays=None):
+        self._by_user = {}  # { user_id: "dd-mm" }
+        self._index = []    # [(month_day, user_id)], sorted
+        for user_id, bday_str in (birthdays or {}).items():
+            user_id = str(user_id)
+            self._by_user[user_id] = bday_str
+            key = month_day_key(bday_str)
+            if key is not None:
+                self._index.append((key, user_id))
+        self._index.sort()
+
+    def __len__(self):
+        return len(self._by_user)
+
+    def set(self, user_id, bday_str):
+        user_id = str(user_id)
+        old_key = month_day_key(self._by_user.get(user_id))
+        if old_key is not None:
+            i = bisect.bisect_left(self._index, (old_key, user_id))
+            if i < len(self._index) and self._index[i] == (old_key, user_id):
+                del self._index[i]
+        self._by_user[user_id] = bday_str
+        key = month_day_key(bday_str)
+        if key is not None:
+            bisect.insort(self._index, (key, user_id))
+
+    def as_dict(self):
+        """All birthdays in calendar order, followed by any invalid entries."""
+        ordered = {user_id: self._by_user[user_id] for _, user_id in self._index}
+        for user_id, bday_str in self._by_user.items():
+            ordered.setdefault(user_id, bday_str)
+        return ordered
+
+    def upcoming(self, limit, today=None):
+        """Returns up to `limit` (user_id, bday) pairs, starting with today's and wrapping into next year."""
+        start = bisect.bisect_left(self._index, (keys_for_day(today)[0],))
+        entries = self._index[start:start + limit]
+        if len(entries) < limit:
+            entries += self._index[:min(start, limit - len(entries))]
+        return [(user_id, self._by_user[user_id]) for _, user_id in entries]
+
+    def on(self, keys):
+        """Returns the (user_id, bday) pairs whose month-day is in `keys`."""
+        matches = []
+        for key in keys:
+            i = bisect.bisect_left(self._index, (key,))
+            while i < len(self._index) and self._index[i][0] == key:
+                user_id = self._index[i][1]
+                matches.append((user_id, self._by_user[user_id]))
+                i += 1
+        return matches
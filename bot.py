@@ -1,13 +1,34 @@
+import time
+PROCESS_STARTED = time.perf_counter()  # Startup phases are timed from here
+
 import os
 import random
 import json
-import time
 import sys
+import signal
 import threading
-from instagrapi import Client
-from instagrapi.exceptions import LoginRequired
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+
+# The modules below read their settings from the environment when imported
+load_dotenv()
+
 import data_manager as dm
+import metrics
+import decks
+import poller
+import trivia
+import catchup
+import keywords
+import fuzzy
+from membership import MembershipCache
+from usernames import UsernameCache
+from ratelimit import SlidingWindowLimiter
+from commands import command, registry, dispatch, load_plugins, CommandContext
+from outbox import Outbox, OUTBOX_MAX_MESSAGE_CHARS
+from announcements import BirthdayAnnouncer
+from birthdays import month_day_key, days_until
+from startup import FAST_START, StartupTimer, guard_session, start_warm_up
 
 # --- Logger Utility ---
 class Logger:
@@ -34,18 +55,41 @@ class Colors:
 # ----------------- Setup -----------------
 def setup_client():
     """Loads environment variables and logs into Instagram."""
+    # instagrapi takes a while to import, so it is only loaded once we log in
+    from instagrapi import Client
+    from instagrapi.exceptions import LoginRequired
     load_dotenv()
     IG_USERNAME = os.getenv("IG_USERNAME")
     IG_PASSWORD = os.getenv("IG_PASSWORD")
-    GROUP_CHAT_ID = os.getenv("IG_GROUP_CHAT_ID")
-    SESSION_FILE = "session.json"
+    # IG_GROUP_CHAT_IDS takes a comma-separated list; IG_GROUP_CHAT_ID is a single chat
+    GROUP_CHAT_IDS = os.getenv("IG_GROUP_CHAT_IDS") or os.getenv("IG_GROUP_CHAT_ID")
+    # Each worker started by supervisor.py keeps its account's session in its own file
+    SESSION_FILE = os.getenv("IG_SESSION_FILE", "session.json")
 
-    if not all([IG_USERNAME, IG_PASSWORD, GROUP_CHAT_ID]):
-        print(f"{Colors.FAIL}Error: Make sure IG_USERNAME, IG_PASSWORD, and IG_GROUP_CHAT_ID are set in the .env file.{Colors.ENDC}")
+    if not all([IG_USERNAME, IG_PASSWORD, GROUP_CHAT_IDS]):
+        print(f"{Colors.FAIL}Error: Make sure IG_USERNAME, IG_PASSWORD, and IG_GROUP_CHAT_ID (or IG_GROUP_CHAT_IDS) are set in the .env file.{Colors.ENDC}")
+        sys.exit(1)
+    try:
+        group_chat_ids = [str(int(tid)) for tid in GROUP_CHAT_IDS.split(",") if tid.strip()]
+    except ValueError:
+        print(f"{Colors.FAIL}Error: IG_GROUP_CHAT_ID(S) must be numeric thread IDs separated by commas, got '{GROUP_CHAT_IDS}'.{Colors.ENDC}")
         sys.exit(1)
 
     client = Client()
+
+    def relogin():
+        print(f"\r{Colors.WARNING}Session expired. Re-logging in...{Colors.ENDC}")
+        client.login(IG_USERNAME, IG_PASSWORD, relogin=True)
+        client.dump_settings(SESSION_FILE)
+
     try:
+        if FAST_START and os.path.exists(SESSION_FILE):
+            # Trust the saved session without a round-trip; a rejected API call re-logs in
+            client.load_settings(SESSION_FILE)
+            guard_session(client, relogin, (LoginRequired,))
+            print(f"{Colors.GREEN}Using the saved session for {IG_USERNAME}.{Colors.ENDC}")
+            return client, IG_USERNAME, group_chat_ids
+
         if os.path.exists(SESSION_FILE):
             client.load_settings(SESSION_FILE)
             client.login(IG_USERNAME, IG_PASSWORD)
@@ -61,406 +105,801 @@ def setup_client():
             client.login(IG_USERNAME, IG_PASSWORD)
         
         client.dump_settings(SESSION_FILE)
+        guard_session(client, relogin, (LoginRequired,))
         print(f"{Colors.GREEN}Successfully logged in as {IG_USERNAME}.{Colors.ENDC}")
-        return client, IG_USERNAME, int(GROUP_CHAT_ID)
+        return client, IG_USERNAME, group_chat_ids
     except Exception as e:
         print(f"{Colors.FAIL}An error occurred during login: {e}{Colors.ENDC}")
         sys.exit(1)
 
 # ----------------- Game State & Cache -----------------
-game_state = {
-    "trivia": None
-}
-user_cache = {}
-recently_used = {
-    "truths": [], "dares": [], "nhies": [],
-    "trivia": [], "roasts": []
-}
+startup_timer = StartupTimer(PROCESS_STARTED)
+
+def log_startup_phase(name):
+    """Ends a startup phase and records its duration as a metric."""
+    startup_timer.mark(name)
+    metrics.set_gauge("startup_phase_seconds", round(startup_timer.phases[-1][1], 3), phase=name)
+
+username_cache = UsernameCache()
+dm.register_flush_hook(username_cache.save)
+
+# Number of commands that may be handled at the same time
+COMMAND_WORKERS = int(os.getenv("COMMAND_WORKERS", "8"))
+command_pool = None  # ThreadPoolExecutor running handle_command
+outbox = None        # Outbox that sends every reply, in order per chat
+members_cache = MembershipCache()  # Member lists used by !pick, !ship and !roast
+rate_limiter = SlidingWindowLimiter()  # Inbound command limit, keyed by "<thread_id>:<user_id>"
+
+# Per-group-chat state, created on first use
+chat_states = poller.ChatStates()
+
+def get_thread_state(thread_id):
+    """Returns the polling state (a poller.ChatState) for one group chat."""
+    return chat_states.get(thread_id)
+
+def get_poll_stats():
+    """Returns the polling counters and measured message lag of every group chat."""
+    return chat_states.stats()
+
+# --- Shutdown ---
+# Seconds a shutdown may wait for running commands and queued replies before
+# it gives up on them; buffered writes are flushed to disk either way.
+SHUTDOWN_TIMEOUT = float(os.getenv("SHUTDOWN_TIMEOUT", "20"))
+shutting_down = threading.Event()  # Set once a shutdown starts; the listener stops polling
+_shutdown_lock = threading.Lock()
+
+def shutdown(timeout=SHUTDOWN_TIMEOUT):
+    """
+    Stops polling, waits (up to `timeout` seconds) for running commands to
+    finish and every reply to be sent, then flushes scores, decks, cursors
+    and caches to disk. Only the first call does anything.
+    """
+    if not _shutdown_lock.acquire(blocking=False):
+        return
+    shutting_down.set()
+    print(f"\r{Colors.WARNING}Shutting down: finishing commands and sending queued replies (up to {timeout:g}s)...{Colors.ENDC}")
+    if outbox and not outbox.drain(timeout, reserved=True):
+        print(f"\r{Colors.FAIL}Gave up waiting: {outbox.unreleased()} reply(ies) unfinished, {outbox.pending()} unsent.{Colors.ENDC}")
+    dm.flush_all()
+
+def exit_bot():
+    """Shuts down and ends the process, whichever thread calls it."""
+    shutdown()
+    print(f"\n{Colors.HEADER}Bot shutting down. Goodbye!{Colors.ENDC}")
+    # The main thread may be blocked on input(), so end the process directly; everything is flushed
+    os._exit(0)
 
-# --- NEW: Rate Limiting and Blocking State ---
-user_command_timestamps = {}
-blocked_users = {} # Stores { user_id: expiration_timestamp }
-# -----------------------------------------------
+def peek_username(user_id):
+    """Returns a cached username without calling the API, falling back to the ID."""
+    return username_cache.peek(user_id) or str(user_id)
 
-def get_username(client, user_id):
-    """Fetches a username, using a cache to avoid repeated API calls."""
-    if not user_id: return "Unknown"
+def fetch_username(client, user_id):
+    """Looks a username up through the API. Returns None if it can't be found."""
     user_id_str = str(user_id)
-    if user_id_str in user_cache:
-        return user_cache[user_id_str]
     try:
         user = client.user_info_v1(user_id_str)
-        if user:
-            username = user.username
-            user_cache[user_id_str] = username
-            return username
-        return user_id_str
+        return user.username if user else None
     except Exception:
         try:
             user = client.user_info(user_id_str)
-            if user:
-                username = user.username
-                user_cache[user_id_str] = username
-                return username
-            return user_id_str
+            return user.username if user else None
         except Exception as e:
             print(f"\r{Colors.WARNING}Could not fetch username for {user_id_str}: {e}{Colors.ENDC}")
-            return user_id_str
+            return None
 
-def get_unique_item(list_name, item_list):
+def get_username(client, user_id):
+    """Fetches a username, using a cache to avoid repeated API calls."""
+    if not user_id: return "Unknown"
+    user_id_str = str(user_id)
+    found, username = username_cache.lookup(user_id_str)
+    if not found:
+        username = fetch_username(client, user_id_str)
+        username_cache.put(user_id_str, username)
+    return username or user_id_str
+
+def prefetch_usernames(client, user_ids):
+    """Resolves all uncached usernames in one concurrent pass before a list is rendered."""
+    username_cache.prefetch(user_ids, lambda user_id: fetch_username(client, user_id))
+
+def search_keyword(args):
     """
-    Gets a unique item from a list that hasn't been used recently.
-    Resets the list if all items have been used.
+    The words to filter prompts by: the arguments without @mentions, or ""
+    if nothing searchable is left (e.g. only stop words), for an unfiltered draw.
+    """
+    keyword = " ".join(arg for arg in args if not arg.startswith("@"))
+    return keyword if keywords.tokenize(keyword) else ""
+
+def get_unique_item(thread_id, list_name, item_list, keyword=None):
+    """
+    Gets an item from a list that hasn't been used recently in this group chat.
+    Items are dealt from a shuffled deck that is reshuffled once every item has been used.
+    With a keyword, only items containing its words are dealt, from a deck of their own.
     """
-    global recently_used
     if not item_list:
         return None, "No items found in the list!"
 
-    available_indices = [i for i, _ in enumerate(item_list) if i not in recently_used.get(list_name, [])]
+    if keyword:
+        positions = keywords.lookup(list_name, item_list, keyword)
+        if not positions:
+            return None, None
+        deck = f"{thread_id}:{list_name}:about:{' '.join(sorted(keywords.tokenize(keyword)))}"
+        chosen_index, reshuffled = decks.draw(deck, len(positions), filtered=True)
+        chosen_index = positions[chosen_index]
+    else:
+        chosen_index, reshuffled = decks.draw(f"{thread_id}:{list_name}", len(item_list))
 
     reset_message = None
-    if not available_indices:
-        recently_used[list_name] = []
-        available_indices = list(range(len(item_list)))
+    if reshuffled:
         reset_message = "(All questions have been used. Starting over!)"
 
-    chosen_index = random.choice(available_indices)
-    recently_used[list_name].append(chosen_index)
-    
     return item_list[chosen_index], reset_message
 
 
-# ----------------- Command Handler -----------------
-def handle_command(client, user_id, command, args):
-    """Processes bot commands and returns a response."""
-    global game_state
-    response = ""
-    username = get_username(client, user_id)
-
-    # ---- HELP ----
-    if command == "!help":
-        response = (
-            "🤖 Instagram Chat Bot Commands 🤖\n\n"
-            "🎉 Fun Commands:\n\n"
-            "!truth - Get a truth question.\n"
-            "!dare - Get a dare challenge.\n"
-            "!nhie - Never Have I Ever question.\n"
-            "!roast [@user] - Roast a user or a random member.\n\n"
-            "🕹️ Game Commands:\n\n"
-            "!trivia - Start a trivia challenge.\n"
-            "Fun: \n\n"
-            "!pick - Pick a random member from the group.\n"
-            "!ship [@user] - Ship a user with a random member.\n"
-            "!8ball - Ask the Magic 8-Ball a question.\n\n"
-            "Utilities: \n\n"
-            "!leaderboard - View the game leaderboard.\n"
-            "!setbday <dd-mm> - Set your birthday.\n"
-            "!birthdays - View upcoming birthdays.\n\n"
-            "Type commands starting with '!' to interact with the bot!\n\n"
-            "Coded with love by @linxfaizan"
-        )
-
-    # ---- FUN COMMANDS ----
-    elif command == "!truth":
-        truths = dm.load_list("truths.txt")
-        chosen, reset_msg = get_unique_item("truths", truths)
-        if not chosen: response = "🚫 No truths found!"
-        else:
-            response = f"🗣️ Truth for @{username}:\n\n_{chosen}_"
-            if reset_msg: response += f"\n\n_{reset_msg}_"
-
-    elif command == "!dare":
-        dares = dm.load_list("dares.txt")
-        chosen, reset_msg = get_unique_item("dares", dares)
-        if not chosen: response = "🚫 No dares found!"
-        else:
-            response = f"😈 Dare for @{username}:\n\n_{chosen}_"
-            if reset_msg: response += f"\n\n_{reset_msg}_"
-        
-    elif command == "!nhie":
-        nhies = dm.load_list("nhie.txt")
-        chosen, reset_msg = get_unique_item("nhies", nhies)
-        if not chosen: response = "🚫 No NHIE questions found!"
-        else:
-            response = f"🤫 Never Have I Ever, @{username}...\n\n_{chosen}_"
-            if reset_msg: response += f"\n\n_{reset_msg}_"
-        
-    elif command == "!roast":
-        roasts = dm.load_list("roasts.txt")
-        roast, reset_msg = get_unique_item("roasts", roasts)
-        target_user = f"@{username}"
-        if args and args[0].startswith('@'):
-            target_user = args[0]
-        else:
-            try:
-                thread = client.direct_thread(str(client.IG_GROUP_CHAT_ID))
-                members = [user for user in thread.users if str(user.pk) != str(user_id)]
-                if members: target_user = f"@{random.choice(members).username}"
-            except Exception: pass
-        response = f"🔥 {target_user}, {roast}"
-        if reset_msg: response += f"\n\n_{reset_msg}_"
-        
-    # ---- SOCIAL COMMANDS ----
-    elif command == "!pick":
-        try:
-            thread = client.direct_thread(thread_id=str(client.IG_GROUP_CHAT_ID))
-            if not thread.users:
-                 response = "Couldn't find any members to pick from!"
-            else:
-                chosen_one = random.choice(thread.users)
-                response = f"🎲 The bot has chosen: @{chosen_one.username}"
-        except Exception as e:
-            print(f"\r{Colors.FAIL}Error in !pick: {e}{Colors.ENDC}")
-            response = "🔮 My crystal ball is cloudy... I can't pick anyone right now."
-            
-    elif command == "!ship":
-        try:
-            thread = client.direct_thread(thread_id=str(client.IG_GROUP_CHAT_ID))
-            members = thread.users
-            if len(members) < 2:
-                response = "Not enough members to ship!"
-            else:
-                user1_name, user2_name = "", ""
-                if args and args[0].startswith('@'):
-                    user1_name = args[0].lstrip('@')
-                    other_members = [m for m in members if m.username.lower() != user1_name.lower()]
-                    if other_members:
-                        user2_name = random.choice(other_members).username
-                    else:
-                        response = "Can't ship someone with themselves!"
-                else:
-                    user1_obj, user2_obj = random.sample(members, 2)
-                    user1_name, user2_name = user1_obj.username, user2_obj.username
-                
-                if user1_name and user2_name:
-                    response = f"❤️ Ship: @{user1_name} x @{user2_name} ❤️"
-        except Exception as e:
-            print(f"\r{Colors.FAIL}Error in !ship: {e}{Colors.ENDC}")
-            response = "🚢 The love boat is currently docked due to technical difficulties."
+# ----------------- Command Handlers -----------------
+# Each built-in command is registered in the `commands` registry. Handlers get a
+# CommandContext; ctx.username and ctx.members are only fetched when used.
+# More commands can be added as plugins in the 'plugins' directory.
+
+HELP_TEXT = (
+    "🤖 Instagram Chat Bot Commands 🤖\n\n"
+    "🎉 Fun Commands:\n\n"
+    "!truth [keyword] - Get a truth question.\n"
+    "!dare [keyword] - Get a dare challenge.\n"
+    "!nhie - Never Have I Ever question.\n"
+    "!roast [@user] - Roast a user or a random member.\n\n"
+    "🕹️ Game Commands:\n\n"
+    "!trivia [easy|medium|hard] [topic] - Start a trivia challenge.\n"
+    "!trivia round [count] [difficulty] [topic] - Play a timed round of questions.\n"
+    "Fun: \n\n"
+    "!pick - Pick a random member from the group.\n"
+    "!ship [@user] - Ship a user with a random member.\n"
+    "!8ball - Ask the Magic 8-Ball a question.\n\n"
+    "Utilities: \n\n"
+    "!leaderboard [today|week] - View the game leaderboard.\n"
+    "!setbday <dd-mm> - Set your birthday.\n"
+    "!birthdays - View the next upcoming birthdays.\n\n"
+    "Type commands starting with '!' to interact with the bot!\n\n"
+    "Coded with love by @linxfaizan"
+)
+
+# ---- HELP ----
+@command("!help", needs_username=False)
+def cmd_help(ctx):
+    plugin_lines = sorted({f"{cmd.name} - {cmd.help}" for cmd in registry.values() if cmd.help and cmd.module != __name__})
+    if not plugin_lines:
+        return HELP_TEXT
+    return HELP_TEXT + "\n\n🧩 More Commands:\n\n" + "\n".join(plugin_lines)
+
+# ---- FUN COMMANDS ----
+@command("!truth")
+def cmd_truth(ctx):
+    truths = dm.load_list("truth.txt")
+    keyword = search_keyword(ctx.args)
+    chosen, reset_msg = get_unique_item(ctx.thread_id, "truths", truths, keyword)
+    if not chosen: return f"🚫 No truths about '{keyword}' found!" if keyword else "🚫 No truths found!"
+    response = f"🗣️ Truth for @{ctx.username}:\n\n_{chosen}_"
+    if reset_msg: response += f"\n\n_{reset_msg}_"
+    return response
 
+@command("!dare")
+def cmd_dare(ctx):
+    dares = dm.load_list("dares.txt")
+    keyword = search_keyword(ctx.args)
+    chosen, reset_msg = get_unique_item(ctx.thread_id, "dares", dares, keyword)
+    if not chosen: return f"🚫 No dares about '{keyword}' found!" if keyword else "🚫 No dares found!"
+    response = f"😈 Dare for @{ctx.username}:\n\n_{chosen}_"
+    if reset_msg: response += f"\n\n_{reset_msg}_"
+    return response
 
-    # ---- GAME COMMANDS ----
+@command("!nhie")
+def cmd_nhie(ctx):
+    nhies = dm.load_list("nhie.txt")
+    chosen, reset_msg = get_unique_item(ctx.thread_id, "nhies", nhies)
+    if not chosen: return "🚫 No NHIE questions found!"
+    response = f"🤫 Never Have I Ever, @{ctx.username}...\n\n_{chosen}_"
+    if reset_msg: response += f"\n\n_{reset_msg}_"
+    return response
 
-    elif command == "!trivia":
-        trivia = dm.load_json_from_lists("trivia.json")
-        q, reset_msg = get_unique_item("trivia", trivia)
-        if not q: response = "🚫 No trivia questions found!"
-        else:
-            game_state["trivia"] = {"answer": q["answer"].lower(), "user": user_id}
-            options = "\n".join([f"*{k.upper()}:* {v}" for k, v in q['options'].items()])
-            response = f"🧠 Trivia for @{username}: 🧠\n\n*{q['question']}*\n\n{options}\n\nReply with `!answer <A/B/C/D>`"
-            if reset_msg: response += f"\n\n_{reset_msg}_"
-
-    elif command == "!answer" and args:
-        ans = " ".join(args).lower()
-        if game_state["trivia"]:
-            correct = game_state["trivia"]["answer"]
-            if ans == correct:
-                dm.add_score(str(user_id))
-                response = f"✅ Correct, @{username}! The answer was *{correct.upper()}*. (+1 point!)"
-                game_state["trivia"] = None
-            else:
-                response = f"❌ That's not the right option, @{username}! Guess again."
-        else:
-            response = "❓ No active trivia question!"
-
-    # ---- UTILITY & FUN ----
-    elif command == "!skip":
-        if game_state["trivia"]:
-            correct = game_state["trivia"]["answer"]
-            response = f"😕 The trivia has been skipped! The correct option was *{correct.upper()}*."
-            game_state["trivia"] = None
-        else:
-            response = "🤷‍♀️ There's no active game to skip!"
+@command("!roast")
+def cmd_roast(ctx):
+    roasts = dm.load_list("roasts.txt")
+    roast, reset_msg = get_unique_item(ctx.thread_id, "roasts", roasts)
+    target_user = f"@{ctx.username}"
+    if ctx.args and ctx.args[0].startswith('@'):
+        target_user = ctx.args[0]
+    else:
+        try:
+            members = [user for user in ctx.members if str(user.pk) != ctx.user_id]
+            if members: target_user = f"@{random.choice(members).username}"
+        except Exception: pass
+    response = f"🔥 {target_user}, {roast}"
+    if reset_msg: response += f"\n\n_{reset_msg}_"
+    return response
 
-    elif command == "!8ball":
-        response = f"🎱 @{username}, the Magic 8-Ball says: *{random.choice(['Yes, definitely.', 'No, certainly not.', 'Perhaps.', 'Ask again later.'])}*"
+# ---- SOCIAL COMMANDS ----
+@command("!pick", needs_username=False)
+def cmd_pick(ctx):
+    try:
+        members = ctx.members
+        if not members:
+            return "Couldn't find any members to pick from!"
+        chosen_one = random.choice(members)
+        return f"🎲 The bot has chosen: @{chosen_one.username}"
+    except Exception as e:
+        print(f"\r{Colors.FAIL}Error in !pick: {e}{Colors.ENDC}")
+        return "🔮 My crystal ball is cloudy... I can't pick anyone right now."
 
-    elif command == "!leaderboard":
-        board = dm.get_leaderboard()
-        if not board: response = "🏆 Leaderboard is empty!"
-        else:
-            leaderboard_lines = [f"🥇 @{get_username(client, board[0][0])}: {board[0][1]}"]
-            if len(board) > 1: leaderboard_lines.append(f"🥈 @{get_username(client, board[1][0])}: {board[1][1]}")
-            if len(board) > 2: leaderboard_lines.append(f"🥉 @{get_username(client, board[2][0])}: {board[2][1]}")
-            for i, (uid, s) in enumerate(board[3:10]):
-                leaderboard_lines.append(f"{i+4}. @{get_username(client, uid)}: {s}")
-            response = "🏆 *Leaderboard* 🏆\n\n" + "\n".join(leaderboard_lines)
-
-    elif command == "!files":
-        files = dm.get_list_file_details()
-        response = "📚 *Available Content Lists:*\n" + "\n".join(files)
-        
-    elif command == "!setbday" and args:
-        if len(args[0].split('-')) == 2:
-            dm.set_birthday(user_id, args[0])
-            response = f"🎂 Birthday for @{username} set to {args[0]}."
+@command("!ship", needs_username=False)
+def cmd_ship(ctx):
+    try:
+        members = ctx.members
+        if len(members) < 2:
+            return "Not enough members to ship!"
+        if ctx.args and ctx.args[0].startswith('@'):
+            user1_name = ctx.args[0].lstrip('@')
+            other_members = [m for m in members if m.username.lower() != user1_name.lower()]
+            if not other_members:
+                return "Can't ship someone with themselves!"
+            user2_name = random.choice(other_members).username
         else:
-            response = "Please use the format `dd-mm` (e.g., `!setbday 25-12`)."
+            user1_obj, user2_obj = random.sample(members, 2)
+            user1_name, user2_name = user1_obj.username, user2_obj.username
+        return f"❤️ Ship: @{user1_name} x @{user2_name} ❤️"
+    except Exception as e:
+        print(f"\r{Colors.FAIL}Error in !ship: {e}{Colors.ENDC}")
+        return "🚢 The love boat is currently docked due to technical difficulties."
+
+# ---- GAME COMMANDS ----
+def format_trivia_question(client, session):
+    """Renders an open question, as the first question for whoever asked or as part of a round."""
+    q = session.question
+    options = "\n".join([f"*{k.upper()}:* {v}" for k, v in q['options'].items()])
+    if session.round:
+        header = f"🧠 Question {session.round.number}/{session.round.total}: 🧠"
+    else:
+        header = f"🧠 Trivia for @{get_username(client, session.user_id)}: 🧠"
+    response = f"{header}\n\n*{q['question']}*\n\n{options}\n\nReply with `!answer <A/B/C/D>` within {int(session.timeout)}s"
+    if session.reshuffled: response += "\n\n_(All questions have been used. Starting over!)_"
+    return response
 
-    elif command == "!birthdays":
-        bdays = dm.get_all_birthdays()
-        if not bdays: response = "No birthdays have been set yet!"
-        else:
-            bday_lines = [f"@{get_username(client, uid)}: {d}" for uid, d in bdays.items()]
-            response = "🎂 *Upcoming Birthdays* 🎂\n\n" + "\n".join(bday_lines)
-            
-    elif command == "!exit":
-        response = "🤖 Shutting down... Goodbye!"
-        # You MUST send the response *before* you exit,
-        # or the script will die before the message is sent.
-        try:
-            client.direct_send(response, thread_ids=[str(client.IG_GROUP_CHAT_ID)])
-        except Exception as e:
-            print(f"Couldn't send final message: {e}")
-        
-        # This force-quits the ENTIRE script (both threads)
-        os._exit(0)
-
-    # --- Fallback for custom commands ---
-    elif command == "!addcmd":
-        # Split the message into 3 parts: !addcmd, !new_command, and the rest
-        message_text = command + (' ' + ' '.join(args) if args else '')
-        parts = message_text.split(' ', 2)            
-            # Check if all 3 parts are present
-        if len(parts) < 3:
-            response = "Usage: !addcmd <!command_name> <response text>"
-            Logger.warning(f"Failed !addcmd attempt from @{username} due to incorrect format.")
-        else:
-            new_cmd = parts[1].lower()
-            # Ensure the new command starts with '!'
-            if not new_cmd.startswith("!"):
-                response = "Command name must start with '!'"
-                Logger.warning(f"Failed !addcmd attempt from @{username} because command did not start with '!'.")
-            else:
-                # Get the response text
-                response_text = parts[2]
-                # Get existing commands and update
-                custom_commands = dm.load_custom_commands()
-                custom_commands[new_cmd] = response_text
-                # Save the dictionary to the 'custom_commands.json' file
-                dm.save_custom_commands(custom_commands)
-                response = f"✅ Custom command '{new_cmd}' added!"
-                Logger.success(f"Added new custom command '{new_cmd}' from @{username}.")
+def format_trivia_followup(client, session):
+    """What comes after a question of a round ends: the next question, or the final standings."""
+    round = session.round
+    if not round:
+        return ""
+    if session.next:
+        return "\n\n" + format_trivia_question(client, session.next)
+    standings = round.standings()
+    if not standings:
+        return "\n\n🏁 The round is over! Nobody scored this time."
+    prefetch_usernames(client, [uid for uid, _ in standings])
+    lines = [f"{i + 1}. @{get_username(client, uid)}: {wins}" for i, (uid, wins) in enumerate(standings)]
+    return "\n\n🏁 *Round over!* 🏁\n\n" + "\n".join(lines)
+
+def on_trivia_expired(session):
+    """
+    Reveals the answer of a question nobody got in time. Called on the timer
+    wheel's thread, which serves every chat's timeouts, so only the reply's
+    slot is reserved here; the reply (which may look up usernames) is built
+    on the command pool.
+    """
+    ticket = outbox.reserve(session.thread_id)
+    command_pool.submit(send_trivia_expired, session, ticket)
 
-    else:
-        custom_response = dm.get_custom_command(command)
-        if custom_response:
-            response = custom_response
+def send_trivia_expired(session, ticket):
+    text = None
+    try:
+        text = f"⏰ Time's up! The correct option was *{session.answer.upper()}*."
+        text += format_trivia_followup(trivia_client, session)
+    except Exception as e:
+        print(f"\r{Colors.FAIL}Error revealing trivia answer in {session.thread_id}: {e}{Colors.ENDC}")
+    finally:
+        outbox.complete(session.thread_id, ticket, text, label="TRIVIA")
+
+trivia_client = None  # Set by start_workers; used to render expiry messages
+trivia_engine = trivia.TriviaEngine(on_trivia_expired)
+
+@command("!trivia")
+def cmd_trivia(ctx):
+    args = [arg.lower() for arg in ctx.args]
+    is_round = bool(args) and args[0] == "round"
+    if is_round:
+        args = args[1:]
+    count = trivia.TRIVIA_ROUND_DEFAULT
+    difficulty = None
+    topic_words = []
+    for arg in args:
+        if is_round and arg.isdigit():
+            count = max(1, min(int(arg), trivia.TRIVIA_ROUND_MAX))
+        elif arg in trivia.DIFFICULTIES and difficulty is None:
+            difficulty = arg
         else:
-            response = f"❓ Unknown command: {command}. Type `!help` for a list of commands."
-    return response
+            topic_words.append(arg)
+    topic = search_keyword(topic_words) or None
+    not_found = f"🚫 No trivia questions about '{topic}' found!" if topic else "🚫 No trivia questions found!"
+
+    if is_round:
+        session, started = trivia_engine.start_round(ctx.thread_id, ctx.user_id, count, difficulty, topic)
+        if not session: return not_found
+        if not started:
+            return "🏁 A trivia round is already running!\n\n" + format_trivia_question(ctx.client, session)
+        intro = f"🏁 Trivia round: {count} questions, {int(session.timeout)}s each. The first correct answer scores!"
+        return intro + "\n\n" + format_trivia_question(ctx.client, session)
+
+    session = trivia_engine.ask(ctx.thread_id, ctx.user_id, difficulty, topic)
+    if not session: return not_found
+    if session.round:
+        return "🏁 A trivia round is running!\n\n" + format_trivia_question(ctx.client, session)
+    return format_trivia_question(ctx.client, session)
+
+@command("!answer", usage="!answer <A/B/C/D>")
+def cmd_answer(ctx):
+    ans = " ".join(ctx.args).lower()
+    status, session = trivia_engine.answer(ctx.thread_id, ctx.user_id, ans)
+    if status == "none":
+        return "❓ No active trivia question!"
+    if status == "wrong":
+        return f"❌ That's not the right option, @{ctx.username}! Guess again."
+    dm.add_score(ctx.user_id)
+    response = f"✅ Correct, @{ctx.username}! The answer was *{session.answer.upper()}*. (+1 point!)"
+    return response + format_trivia_followup(ctx.client, session)
+
+# ---- UTILITY & FUN ----
+@command("!skip", needs_username=False)
+def cmd_skip(ctx):
+    session = trivia_engine.skip(ctx.thread_id, ctx.user_id)
+    if not session:
+        return "🤷‍♀️ There's no active game to skip!"
+    response = f"😕 The trivia has been skipped! The correct option was *{session.answer.upper()}*."
+    return response + format_trivia_followup(ctx.client, session)
+
+@command("!8ball")
+def cmd_8ball(ctx):
+    return f"🎱 @{ctx.username}, the Magic 8-Ball says: *{random.choice(['Yes, definitely.', 'No, certainly not.', 'Perhaps.', 'Ask again later.'])}*"
+
+# { argument: (period, title, text when empty) }
+LEADERBOARD_PERIODS = {
+    "all": ("all", "Leaderboard", "🏆 Leaderboard is empty!"),
+    "today": ("today", "Today's Leaderboard", "🏆 No points scored today yet!"),
+    "week": ("week", "This Week's Leaderboard", "🏆 No points scored this week yet!"),
+}
+LEADERBOARD_PERIODS["day"] = LEADERBOARD_PERIODS["today"]
+_leaderboard_text = {}  # { period: (board version, rendered text) }
+
+@command("!leaderboard", needs_username=False)
+def cmd_leaderboard(ctx):
+    client = ctx.client
+    period_arg = ctx.args[0].lower() if ctx.args else "all"
+    if period_arg not in LEADERBOARD_PERIODS:
+        return "Usage: !leaderboard [today|week]"
+    period, title, empty_text = LEADERBOARD_PERIODS[period_arg]
+
+    # The rendered board is reused until its top rows change
+    version = dm.get_leaderboard_version(period)
+    cached = _leaderboard_text.get(period)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    board = dm.get_leaderboard(10, period)
+    if not board: return empty_text
+    prefetch_usernames(client, [uid for uid, _ in board])
+    leaderboard_lines = [f"🥇 @{get_username(client, board[0][0])}: {board[0][1]}"]
+    if len(board) > 1: leaderboard_lines.append(f"🥈 @{get_username(client, board[1][0])}: {board[1][1]}")
+    if len(board) > 2: leaderboard_lines.append(f"🥉 @{get_username(client, board[2][0])}: {board[2][1]}")
+    for i, (uid, s) in enumerate(board[3:10]):
+        leaderboard_lines.append(f"{i+4}. @{get_username(client, uid)}: {s}")
+    text = f"🏆 *{title}* 🏆\n\n" + "\n".join(leaderboard_lines)
+    _leaderboard_text[period] = (version, text)
+    return text
+
+@command("!files", needs_username=False)
+def cmd_files(ctx):
+    files = dm.get_list_file_details()
+    return "📚 *Available Content Lists:*\n" + "\n".join(files)
+
+@command("!setbday", usage="!setbday <dd-mm>")
+def cmd_setbday(ctx):
+    if month_day_key(ctx.args[0]) is None:
+        return "Please use the format `dd-mm` (e.g., `!setbday 25-12`)."
+    dm.set_birthday(ctx.user_id, ctx.args[0])
+    return f"🎂 Birthday for @{ctx.username} set to {ctx.args[0]}."
+
+UPCOMING_BIRTHDAYS_SHOWN = 10
+
+@command("!birthdays", needs_username=False)
+def cmd_birthdays(ctx):
+    client = ctx.client
+    bdays = dm.get_upcoming_birthdays(UPCOMING_BIRTHDAYS_SHOWN)
+    if not bdays: return "No birthdays have been set yet!"
+    prefetch_usernames(client, [uid for uid, _ in bdays])
+    bday_lines = []
+    for uid, d in bdays:
+        days = days_until(d)
+        when = "today! 🎉" if days == 0 else "tomorrow" if days == 1 else f"in {days} days"
+        bday_lines.append(f"@{get_username(client, uid)}: {d} ({when})")
+    return "🎂 *Upcoming Birthdays* 🎂\n\n" + "\n".join(bday_lines)
+
+@command("!exit", needs_username=False, admin_only=True)
+def cmd_exit(ctx):
+    # The shutdown runs on its own thread, so this reply is released and
+    # sent (after the ones already queued) before the process ends
+    threading.Thread(target=exit_bot, name="shutdown").start()
+    return "🤖 Shutting down... Goodbye!"
+
+# ---- CUSTOM COMMANDS ----
+# Longest custom command name, '!' included; every name is indexed for typo lookups
+CUSTOM_COMMAND_MAX_CHARS = int(os.getenv("CUSTOM_COMMAND_MAX_CHARS", "30"))
+
+@command("!addcmd", needs_username=False)
+def cmd_addcmd(ctx):
+    # Split the message into 3 parts: !addcmd, !new_command, and the rest
+    message_text = ctx.command + (' ' + ' '.join(ctx.args) if ctx.args else '')
+    parts = message_text.split(' ', 2)
+    # Check if all 3 parts are present
+    if len(parts) < 3:
+        Logger.warning(f"Failed !addcmd attempt from @{ctx.username} due to incorrect format.")
+        return "Usage: !addcmd <!command_name> <response text>"
+    new_cmd = parts[1].lower()
+    # Ensure the new command starts with '!'
+    if not new_cmd.startswith("!"):
+        Logger.warning(f"Failed !addcmd attempt from @{ctx.username} because command did not start with '!'.")
+        return "Command name must start with '!'"
+    if len(new_cmd) > CUSTOM_COMMAND_MAX_CHARS:
+        Logger.warning(f"Failed !addcmd attempt from @{ctx.username} because the command name was too long.")
+        return f"Command name must be at most {CUSTOM_COMMAND_MAX_CHARS} characters"
+    # Save the command (to 'custom_commands.json' or the database)
+    dm.set_custom_command(new_cmd, parts[2])
+    command_index.add(new_cmd)
+    Logger.success(f"Added new custom command '{new_cmd}' from @{ctx.username}.")
+    return f"✅ Custom command '{new_cmd}' added!"
+
+# ---- ADMIN ----
+@command("!stats", needs_username=False, admin_only=True)
+def cmd_stats(ctx):
+    metrics.render_prometheus()  # Refreshes the collected gauges
+    lines = ["📊 *Bot Stats* 📊", "", "⏱️ Commands (count, avg, p95):"]
+    latencies = sorted(metrics.histograms("command_latency_seconds").items(), key=lambda item: -item[1].count)
+    for labels, histogram in latencies[:10]:
+        avg_ms = histogram.sum / histogram.count * 1000
+        lines.append(f"{dict(labels)['command']}: {histogram.count}, {avg_ms:.0f}ms, ≤{histogram.quantile(0.95) * 1000:g}ms")
+
+    api_calls = metrics.counters("ig_api_calls_total")
+    total_commands = sum(metrics.counters("commands_total").values()) or 1
+    lines += ["", f"📡 API calls ({sum(api_calls.values()) / total_commands:.2f} per command):"]
+    for labels, count in sorted(api_calls.items(), key=lambda item: -item[1]):
+        lines.append(f"{dict(labels)['endpoint']}: {count}")
+
+    lines += ["", "🗃️ Cache hit rates:"]
+    for name, hits, misses in cache_stats():
+        rate = hits / (hits + misses) * 100 if hits + misses else 0
+        lines.append(f"{name}: {rate:.0f}% ({hits}/{hits + misses})")
+
+    lines += ["", "🔁 Polling:"]
+    for thread_id, stats in get_poll_stats().items():
+        lines.append(f"{thread_id}: {stats['polls']} polls, {stats['errors']} backoffs, lag {stats['last_lag']}s (max {stats['max_lag']}s)")
+    return "\n".join(lines)
+
+def cache_stats():
+    """Returns (name, hits, misses) for the username, content and membership caches."""
+    content = dm.get_content_cache_stats()
+    return [
+        ("usernames", username_cache.hits, username_cache.misses),
+        ("content", content["hits"], content["loads"]),
+        ("membership", members_cache.hits, members_cache.misses),
+    ]
+
+def collect_metrics():
+    """Copies cache, outbox and polling counters into metric gauges."""
+    for name, hits, misses in cache_stats():
+        metrics.set_gauge("cache_hits", hits, cache=name)
+        metrics.set_gauge("cache_misses", misses, cache=name)
+    if outbox:
+        metrics.set_gauge("outbox_pending", outbox.pending())
+        metrics.set_gauge("outbox_sent", outbox.sent)
+        metrics.set_gauge("outbox_coalesced", outbox.coalesced)
+    for thread_id, stats in get_poll_stats().items():
+        for key in ("polls", "idle_polls", "catchup_fetches", "errors", "interval", "last_lag", "max_lag"):
+            metrics.set_gauge(f"poll_{key}", stats[key], thread=thread_id)
+    metrics.set_gauge("trivia_open_questions", trivia_engine.active())
+    windows, blocks = rate_limiter.tracked()
+    metrics.set_gauge("rate_limit_tracked_users", windows)
+    metrics.set_gauge("rate_limit_blocked_users", blocks)
+
+metrics.register_collector(collect_metrics)
+metrics.describe("command_latency_seconds", "Time spent handling a command, by command.")
+metrics.describe("commands_total", "Commands handled, by command and status.")
+metrics.describe("poll_lag_seconds", "Delay between a command being sent and the bot reading it.")
+
+# ----------------- Command Handler -----------------
+def handle_command(client, thread_id, user_id, command, args):
+    """Processes a bot command sent in the given group chat and returns a response."""
+    ctx = CommandContext(
+        client, thread_id, user_id, command, args, get_thread_state(thread_id),
+        resolve_username=get_username, resolve_members=members_cache.get,
+    )
+    response = dispatch(ctx)
+    if response is not None:
+        return response
+
+    # --- Fallback for custom commands (served from memory) ---
+    custom_response = dm.get_custom_command(command)
+    if custom_response:
+        return custom_response
+    return resolve_unknown_command(client, thread_id, user_id, command, args)
+
+# --- Typo Resolution ---
+# Unknown commands are matched against every built-in and custom command name.
+# If FUZZY_AUTORUN is on, a typo with exactly one command one edit away runs
+# that command; otherwise the nearest commands are suggested.
+FUZZY_AUTORUN = os.getenv("FUZZY_AUTORUN", "true").lower() in ("1", "true", "yes")
+NO_AUTORUN = {"!addcmd", "!setbday"}  # Never run on a guess, like admin commands
+command_index = fuzzy.CommandIndex()
+
+def command_exists(name):
+    return name in registry or dm.get_custom_command(name) is not None
+
+def find_similar_commands(name):
+    """Returns (distance, [names]) of the known commands nearest to `name`, or (None, [])."""
+    command_index.sync("builtin", registry)
+    command_index.sync("custom", dm.get_custom_commands_map())
+    # Short names are only a couple of edits away from too many others
+    max_distance = 1 if len(name) <= 5 else 2
+    return command_index.closest(name, max_distance, exists=command_exists)
+
+def can_autorun(name):
+    cmd = registry.get(name)
+    return name not in NO_AUTORUN and not (cmd and cmd.admin_only)
+
+def resolve_unknown_command(client, thread_id, user_id, command, args):
+    """Answers an unknown command: runs the command it's an unambiguous typo of, or suggests the nearest ones."""
+    distance, matches = find_similar_commands(command)
+    if not matches:
+        return f"❓ Unknown command: {command}. Type `!help` for a list of commands."
+    if FUZZY_AUTORUN and distance == 1 and len(matches) == 1 and can_autorun(matches[0]):
+        return f"🔎 {command} → {matches[0]}\n\n" + handle_command(client, thread_id, user_id, matches[0], args)
+    return f"❓ Unknown command: {command}. Did you mean {' or '.join(matches[:3])}?"
 
 # ----------------- Bot Modes -----------------
-def listen_to_group(client, group_chat_id):
-    """Listens for new messages in the specified group chat and responds."""
-    global user_command_timestamps, blocked_users # <-- Make sure we can access the global dicts
-    
-    print(f"{Colors.CYAN}Listening for messages in group chat ID: {group_chat_id}...{Colors.ENDC}")
-    print(f"{Colors.WARNING}Press CTRL+C in the terminal input below to stop the bot.{Colors.ENDC}")
-    seen_messages = set()
-    
+def format_block_duration():
+    hours = rate_limiter.block_seconds / 3600
+    return f"{hours:g} hours" if hours >= 1 else f"{rate_limiter.block_seconds / 60:g} minutes"
+
+def check_rate_limit(thread_id, sender_id):
+    """
+    Applies the per-chat command rate limit (RATE_LIMIT_COMMANDS in RATE_LIMIT_WINDOW seconds).
+    Returns "ok" if the command may be processed, "blocked" if the sender is blocked,
+    or "just_blocked" if this command got the sender blocked.
+    """
+    sender_username = peek_username(sender_id)
+    status = rate_limiter.check(f"{thread_id}:{sender_id}")
+
+    if status == "blocked":
+        print(f"\r{Colors.WARNING}Ignoring command from blocked user: @{sender_username}{Colors.ENDC}")
+    elif status == "unblocked":
+        print(f"\r{Colors.GREEN}User @{sender_username} is now unblocked.{Colors.ENDC}")
+        status = "ok"
+    elif status == "just_blocked":
+        print(f"\r{Colors.FAIL}Blocking user @{sender_username} for {format_block_duration()}.{Colors.ENDC}")
+    return status
+
+def command_label(cmd):
+    """Metric label for a command; custom and unknown commands are grouped to bound cardinality."""
+    if cmd in registry:
+        return registry[cmd].name
+    return "custom" if dm.get_custom_command(cmd) else "unknown"
+
+def execute_command(client, thread_id, sender_id, cmd, args):
+    """Runs one command and records its metrics. Returns the reply, or None if the handler failed."""
+    reply = None
+    status = "ok"
+    started = time.perf_counter()
     try:
-        thread = client.direct_thread(thread_id=str(group_chat_id), amount=20)
-        for message in thread.messages: seen_messages.add(message.id)
-        print(f"{Colors.GREEN}Ignoring {len(seen_messages)} pre-existing messages.{Colors.ENDC}")
+        reply = handle_command(client, thread_id, sender_id, cmd, args)
     except Exception as e:
-        print(f"{Colors.FAIL}\nCould not fetch initial messages for group chat: {e}{Colors.ENDC}")
-        return
+        status = "error"
+        print(f"\r{Colors.FAIL}Error handling {cmd} in {thread_id}: {e}{Colors.ENDC}")
+    finally:
+        label = command_label(cmd)
+        metrics.observe("command_latency_seconds", time.perf_counter() - started, command=label)
+        metrics.inc("commands_total", command=label, status=status)
+    return reply
+
+def run_command(client, thread_id, sender_id, cmd, args, ticket):
+    """Runs one command on a worker thread and hands the reply to the outbox."""
+    reply = None
+    try:
+        reply = execute_command(client, thread_id, sender_id, cmd, args)
+    finally:
+        outbox.complete(thread_id, ticket, reply)
 
-    backoff_delay = 60
-    max_backoff = 600
+def send_block_notice(client, thread_id, sender_id, ticket):
+    """Tells a user they have been blocked for sending commands too fast."""
+    block_reply = f"@{get_username(client, sender_id)} You are sending commands too fast! You have been blocked for {format_block_duration()}."
+    outbox.complete(thread_id, ticket, block_reply)
 
-    while True:
-        try:
-            thread = client.direct_thread(thread_id=str(group_chat_id), amount=5)
-            if not thread or not thread.messages:
-                time.sleep(1)
+def queue_catchup(client, thread_id, missed):
+    """
+    Collapses the commands sent while a chat was unreachable and queues the
+    survivors to be answered together by run_catchup.
+    """
+    kept, dropped = catchup.collapse(
+        missed, lambda sender_id: trivia_engine.has_open(thread_id, sender_id), per_user=trivia_engine.per_user,
+    )
+    commands = []
+    for command in kept:
+        status = check_rate_limit(thread_id, command.sender_id)
+        if status == "ok" or status == "just_blocked":
+            commands.append((command, status))
+        else:
+            dropped += 1
+    if not commands:
+        return
+    print(f"\r{Colors.CYAN}[{thread_id}] Catching up on {len(commands)} missed command(s), {dropped} dropped as outdated.{Colors.ENDC}")
+    # One slot per command keeps newer replies behind the batch, however many messages it needs
+    tickets = [outbox.reserve(thread_id, source=command.message_id) for command, _ in commands]
+    command_pool.submit(run_catchup, client, thread_id, commands, dropped, tickets)
+
+def run_catchup(client, thread_id, commands, dropped, tickets):
+    """Answers missed commands in order and sends the replies as one batch, split only where it must be."""
+    replies = []
+    try:
+        for command, status in commands:
+            if status == "just_blocked":
+                replies.append(f"@{get_username(client, command.sender_id)} You are sending commands too fast! You have been blocked for {format_block_duration()}.")
+                continue
+            reply = execute_command(client, thread_id, command.sender_id, command.cmd, command.args)
+            if reply:
+                replies.append(reply)
+    finally:
+        header = f"⏳ Sorry for the wait! Catching up on {len(commands)} missed command(s)"
+        if dropped:
+            header += f" ({dropped} outdated skipped)"
+        messages = catchup.pack_replies([header + ":"] + replies, OUTBOX_MAX_MESSAGE_CHARS) if replies else []
+        if len(messages) > len(tickets):
+            messages[len(tickets) - 1:] = ["\n\n".join(messages[len(tickets) - 1:])]
+        for i, ticket in enumerate(tickets):
+            outbox.complete(thread_id, ticket, messages[i] if i < len(messages) else None, label="CATCH-UP")
+
+def start_workers(client):
+    """Starts the command worker pool and the outbox sender, once."""
+    global command_pool, outbox, trivia_client
+    metrics.instrument_client(client)
+    trivia_client = client
+    if command_pool is None:
+        command_pool = ThreadPoolExecutor(max_workers=COMMAND_WORKERS, thread_name_prefix="command")
+    if outbox is None:
+        outbox = Outbox(client, on_sent=log_sent, on_error=log_send_error)
+
+def log_sent(thread_id, text, label, sources):
+    print(f"\r{Colors.GREEN}[{label}]: {text.splitlines()[0]}{' ' * 20}{Colors.ENDC}")
+
+def log_send_error(thread_id, text, error, retry_in):
+    outcome = f"retrying in {retry_in:g}s" if retry_in is not None else "giving up"
+    print(f"\r{Colors.FAIL}Error sending message to {thread_id} ({outcome}): {error}{Colors.ENDC}")
+
+def poll_group(client, group_chat_id):
+    """
+    Fetches the latest messages of one group chat and queues any new commands.
+    Commands run on the worker pool, so polling never waits on a handler.
+    """
+    state = get_thread_state(group_chat_id)
+    seen_messages = state.seen_messages
+    schedule = state.poll
+    catching_up = schedule.catching_up  # Commands found now were sent during an outage
+    missed = []
+
+    thread, new_messages = poller.fetch_new_messages(client, group_chat_id, schedule, seen_messages)
+    if thread:
+        # The poll already returned the member list, so keep the cache fresh for free
+        members_cache.update(group_chat_id, thread.users)
+    new_commands = 0
+
+    for last_message in new_messages:
+        seen_messages.add(last_message.id)
+
+        if last_message.item_type != 'text': continue
+
+        text = last_message.text
+        sender_id = str(last_message.user_id) # <-- Use string ID for consistency
+
+        # Use \r to move cursor to the beginning of the line to not mess up the input prompt
+        print(f"\r{Colors.BLUE}[{peek_username(sender_id)}]: {text}{' ' * 20}{Colors.ENDC}")
+
+        if text and text.startswith("!"):
+            new_commands += 1
+            lag = schedule.record_lag(last_message)
+            if lag is not None:
+                metrics.observe("poll_lag_seconds", lag)
+            parts = text.split()
+            cmd, args = parts[0].lower(), parts[1:]
+            if catching_up:
+                # Rate-limited after collapsing, so repeats sent during the outage don't count
+                missed.append(catchup.MissedCommand(last_message.id, sender_id, cmd, args))
                 continue
+            status = check_rate_limit(group_chat_id, sender_id)
+            if status == "just_blocked":
+                ticket = outbox.reserve(group_chat_id, source=last_message.id)
+                command_pool.submit(send_block_notice, client, group_chat_id, sender_id, ticket)
+            if status != "ok":
+                continue
+
+            ticket = outbox.reserve(group_chat_id, source=last_message.id)
+            command_pool.submit(run_command, client, group_chat_id, sender_id, cmd, args, ticket)
 
-            for last_message in reversed(thread.messages):
-                if last_message.id in seen_messages: continue
-                seen_messages.add(last_message.id)
-                
-                if last_message.item_type != 'text': continue
-
-                text = last_message.text
-                sender_id = str(last_message.user_id) # <-- Use string ID for consistency
-                sender_username = get_username(client, sender_id)
-                
-                # Use \r to move cursor to the beginning of the line to not mess up the input prompt
-                print(f"\r{Colors.BLUE}[{sender_username}]: {text}{' ' * 20}{Colors.ENDC}")
-
-                if text and text.startswith("!"):
-                    
-                    # --- START: NEW RATE LIMITING LOGIC ---
-                    current_time = time.time()
-
-                    # 1. Check if user is currently blocked
-                    if sender_id in blocked_users:
-                        if current_time < blocked_users[sender_id]:
-                            # User is still blocked, ignore the command and skip to the next message
-                            print(f"\r{Colors.WARNING}Ignoring command from blocked user: @{sender_username}{Colors.ENDC}")
-                            continue
-                        else:
-                            # Block has expired, remove them from the list
-                            del blocked_users[sender_id]
-                            print(f"\r{Colors.SUCCESS}User @{sender_username} is now unblocked.{Colors.ENDC}")
-
-                    # 2. Track the command timestamp
-                    if sender_id not in user_command_timestamps:
-                        user_command_timestamps[sender_id] = []
-                    
-                    # 3. Clean up old timestamps (older than 60 seconds)
-                    one_minute_ago = current_time - 60
-                    user_command_timestamps[sender_id] = [
-                        ts for ts in user_command_timestamps[sender_id] if ts > one_minute_ago
-                    ]
-                    
-                    # 4. Add the new command's timestamp
-                    user_command_timestamps[sender_id].append(current_time)
-                    
-                    # 5. Check if the user has exceeded the limit (7 commands in 60 seconds)
-                    if len(user_command_timestamps[sender_id]) > 7:
-                        # Block the user for 3 hours (3 * 60 * 60 seconds)
-                        block_duration_seconds = 3 * 3600
-                        expiration_time = current_time + block_duration_seconds
-                        blocked_users[sender_id] = expiration_time
-                        
-                        # Clear their timestamps so they don't get re-blocked
-                        user_command_timestamps[sender_id] = []
-
-                        # Inform the user and log it
-                        block_reply = f"@{sender_username} You are sending commands too fast! You have been blocked for 3 hours."
-                        client.direct_send(block_reply, thread_ids=[str(group_chat_id)])
-                        print(f"\r{Colors.FAIL}Blocking user @{sender_username} for 3 hours.{Colors.ENDC}")
-                        
-                        # Skip processing their command
-                        continue
-                    
-                    # --- END: NEW RATE LIMITING LOGIC ---
-
-                    # If user is not blocked, proceed as normal
-                    parts = text.split()
-                    cmd, args = parts[0].lower(), parts[1:]
-                    reply = handle_command(client, sender_id, cmd, args)
-                    if reply:
-                        client.direct_send(reply, thread_ids=[str(group_chat_id)])
-                        print(f"\r{Colors.GREEN}[BOT RESPONSE]: {reply.splitlines()[0]}{' ' * 20}{Colors.ENDC}")
-
-            backoff_delay = 60
-            time.sleep(1)
+    if missed:
+        queue_catchup(client, group_chat_id, missed)
+    schedule.record_poll(len(new_messages), new_commands)
+
+def announce_birthdays(client, group_chat_ids, birthdays):
+    """Greets today's birthdays in every group chat they are a member of."""
+    for group_chat_id in group_chat_ids:
+        try:
+            member_ids = {str(user.pk) for user in members_cache.get(client, group_chat_id)}
+        except Exception as e:
+            print(f"\r{Colors.FAIL}Could not fetch members of {group_chat_id} for birthday greetings: {e}{Colors.ENDC}")
+            continue
+        names = [f"@{get_username(client, uid)}" for uid, _ in birthdays if uid in member_ids]
+        if names:
+            outbox.send(group_chat_id, f"🎉 Happy birthday {', '.join(names)}! 🎂🥳", label="BIRTHDAY")
 
+def listen_to_groups(client, group_chat_ids):
+    """
+    Listens for new messages in all the given group chats and responds.
+    One scheduler polls every chat in turn. Each chat's interval adapts to its
+    activity, and a chat that errors backs off on its own without stalling the others.
+    """
+    print(f"{Colors.CYAN}Listening for messages in {len(group_chat_ids)} group chat(s): {', '.join(group_chat_ids)}...{Colors.ENDC}")
+    print(f"{Colors.WARNING}Press CTRL+C in the terminal input below to stop the bot.{Colors.ENDC}")
+    start_workers(client)
+    rate_limiter.start_sweeper()
+    BirthdayAnnouncer(lambda birthdays: announce_birthdays(client, group_chat_ids, birthdays)).start()
+
+    for group_chat_id in group_chat_ids:
+        state = get_thread_state(group_chat_id)
+        if state.poll.seeded:
+            print(f"{Colors.GREEN}[{group_chat_id}] Resuming after message {state.poll.last_message_id}.{Colors.ENDC}")
+            continue
+        if FAST_START:
+            continue  # Seeded by its first poll, so other chats are served meanwhile
+        try:
+            skipped = poller.seed_thread(client, group_chat_id, state.poll, state.seen_messages)
+            print(f"{Colors.GREEN}[{group_chat_id}] Ignoring {skipped} pre-existing messages.{Colors.ENDC}")
         except Exception as e:
-            print(f"\r{Colors.FAIL}An error occurred while listening: {e}{Colors.ENDC}")
-            print(f"\r{Colors.WARNING}Waiting for {backoff_delay} seconds before retrying...{Colors.ENDC}")
-            time.sleep(backoff_delay)
-            backoff_delay = min(backoff_delay * 2, max_backoff)
+            print(f"{Colors.FAIL}\nCould not fetch initial messages for group chat {group_chat_id}: {e}{Colors.ENDC}")
+
+    turn = 0
+    not_yet_polled = set(group_chat_ids)
 
-def handle_terminal_input(client, ig_username, group_chat_id):
+    while not shutting_down.is_set():
+        # Start each round at a different chat so no chat is always served last
+        order = group_chat_ids[turn:] + group_chat_ids[:turn]
+        turn = (turn + 1) % len(group_chat_ids)
+
+        for group_chat_id in order:
+            schedule = get_thread_state(group_chat_id).poll
+            if shutting_down.is_set() or not schedule.is_due():
+                continue
+            try:
+                poll_group(client, group_chat_id)
+            except Exception as e:
+                backoff_delay = schedule.record_error()
+                print(f"\r{Colors.FAIL}An error occurred while listening to {group_chat_id}: {e}{Colors.ENDC}")
+                print(f"\r{Colors.WARNING}Waiting for {backoff_delay} seconds before retrying...{Colors.ENDC}")
+            if not_yet_polled:
+                not_yet_polled.discard(group_chat_id)
+                if not not_yet_polled:
+                    log_startup_phase("first poll")
+                    print(f"\r{Colors.CYAN}Startup: {startup_timer.report()}{Colors.ENDC}")
+
+        next_due = min(get_thread_state(tid).poll.next_poll for tid in group_chat_ids)
+        shutting_down.wait(max(0.05, next_due - time.time()))
+
+def handle_terminal_input(client, ig_username, group_chat_ids):
     """Handles user input from the terminal to send messages."""
     print(f"\n{Colors.CYAN}You can now type messages to send to the group chat.{Colors.ENDC}")
-    print(f"Type '{Colors.WARNING}exit{Colors.ENDC}' to quit.")
+    if len(group_chat_ids) > 1:
+        print(f"Messages go to {group_chat_ids[0]}; use '{Colors.WARNING}/to <thread_id> <message>{Colors.ENDC}' for another chat.")
+    print(f"Type '{Colors.WARNING}/polls{Colors.ENDC}' for polling stats or '{Colors.WARNING}exit{Colors.ENDC}' to quit.")
     
     while True:
         try:
@@ -468,16 +907,36 @@ def handle_terminal_input(client, ig_username, group_chat_id):
             text = input(prompt)
             if text.lower() == 'exit':
                 break
+            if text == "/polls":
+                for thread_id, stats in get_poll_stats().items():
+                    print(f"\r{Colors.CYAN}[{thread_id}] " + ", ".join(f"{k}={v}" for k, v in stats.items()) + Colors.ENDC)
+                continue
+            target_id = group_chat_ids[0]
+            if text.startswith("/to "):
+                parts = text.split(' ', 2)
+                if len(parts) < 3 or parts[1] not in group_chat_ids:
+                    print(f"\r{Colors.WARNING}Usage: /to <thread_id> <message> (one of: {', '.join(group_chat_ids)}){Colors.ENDC}")
+                    continue
+                target_id, text = parts[1], parts[2]
             if text:
-                try:
-                    client.direct_send(text, thread_ids=[str(group_chat_id)])
-                    print(f"\r{Colors.GREEN}[SENT]: {text}{' ' * 20}{Colors.ENDC}")
-                except Exception as e:
-                    print(f"\r{Colors.FAIL}Error sending message: {e}{Colors.ENDC}")
+                # Goes through the outbox so it is ordered with the bot's own replies
+                outbox.send(target_id, text, label="SENT")
         except KeyboardInterrupt:
             break
 
 
+def wait_headless(listener_thread, group_chat_ids):
+    """Runs without terminal input (as a supervisor worker) until interrupted."""
+    print(f"{Colors.CYAN}Worker {dm.WORKER_ID} is serving {len(group_chat_ids)} group chat(s): {', '.join(group_chat_ids)}.{Colors.ENDC}")
+    try:
+        while listener_thread.is_alive():
+            listener_thread.join(1)
+    except KeyboardInterrupt:
+        pass
+
+def raise_keyboard_interrupt(signum, frame):
+    raise KeyboardInterrupt
+
 def main():
     """Main function to start the bot."""
     print(f"""{Colors.GREEN}
@@ -489,21 +948,48 @@ def main():
         ╚═════╝  ╚═════╝    ╚═╝   
     {Colors.ENDC}""")
     print(f"{Colors.HEADER}--- Instagram Chat Bot Initializing ---{Colors.ENDC}")
-    
-    client, ig_username, group_chat_id = setup_client()
-    client.IG_GROUP_CHAT_ID = group_chat_id
+    log_startup_phase("imports")
+
+    # Lists, scores and birthdays are loaded while we log in
+    start_warm_up(lambda seconds: metrics.set_gauge("startup_warm_up_seconds", round(seconds, 3)))
+
+    client, ig_username, group_chat_ids = setup_client()
+    log_startup_phase("login")
+    plugins = load_plugins()
+    if plugins:
+        print(f"{Colors.GREEN}Loaded plugins: {', '.join(plugins)}{Colors.ENDC}")
+    log_startup_phase("plugins")
+    start_workers(client)
+
+    # Buffered score changes are written to disk periodically in the background
+    dm.start_background_flush()
+
+    # Metrics are dumped to METRICS_FILE on every flush and optionally served over HTTP
+    dm.register_flush_hook(metrics.dump_to_file)
+    if metrics.start_http_server():
+        print(f"{Colors.GREEN}Serving metrics on http://127.0.0.1:{metrics.METRICS_PORT}/metrics{Colors.ENDC}")
+
+    # SIGTERM (e.g. from a service manager) shuts down like CTRL+C
+    signal.signal(signal.SIGTERM, raise_keyboard_interrupt)
 
     # Start the listener in a separate, non-blocking thread
     listener_thread = threading.Thread(
-        target=listen_to_group, 
-        args=(client, group_chat_id), 
+        target=listen_to_groups,
+        args=(client, group_chat_ids),
         daemon=True  # This allows the main thread to exit without waiting for this one
     )
     listener_thread.start()
 
-    # The main thread will handle terminal input
-    handle_terminal_input(client, ig_username, group_chat_id)
-    
+    # The main thread will handle terminal input (workers have no terminal of their own)
+    if dm.WORKER_ID:
+        wait_headless(listener_thread, group_chat_ids)
+    else:
+        handle_terminal_input(client, ig_username, group_chat_ids)
+
+    try:
+        shutdown()
+    except KeyboardInterrupt:
+        dm.flush_all()  # Interrupted again while waiting; still save everything
     print(f"\n{Colors.HEADER}Bot shutting down. Goodbye!{Colors.ENDC}")
 
 if __name__ == "__main__":
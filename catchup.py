@@ -0,0 +1,73 @@
+import os
+
+# --- Settings ---
+# Missed commands are answered together after an outage; this caps how many
+# end up in the batch (the newest are kept).
+CATCHUP_MAX_COMMANDS = int(os.getenv("CATCHUP_MAX_COMMANDS", "20"))
+
+TRIVIA_START_COMMANDS = ("!trivia",)
+TRIVIA_REPLY_COMMANDS = ("!answer", "!skip")
+
+# --- Missed Commands ---
+
+class MissedCommand:
+    """A command found by a catch-up pass, not answered yet."""
+
+    def __init__(self, message_id, sender_id, cmd, args):
+        self.message_id = message_id
+        self.sender_id = sender_id
+        self.cmd = cmd
+        self.args = args
+
+def collapse(commands, has_open_question, per_user=False, limit=CATCHUP_MAX_COMMANDS):
+    """
+    Drops the missed commands (oldest first) that are pointless to answer late.
+    Returns (kept, dropped count), kept in their original order.
+
+    - A command repeated by the same sender is answered once, at its latest position.
+    - Only the latest !trivia is asked (per sender if every user gets their own question).
+    - !answer and !skip are only kept while the question they were meant for is
+      still open: `has_open_question(sender_id)` is true and no !trivia came
+      before them in the backlog (that question was never asked).
+    """
+    first_trivia = {}  # { scope: position of the first !trivia }
+    for position, command in enumerate(commands):
+        if command.cmd in TRIVIA_START_COMMANDS:
+            first_trivia.setdefault(command.sender_id if per_user else None, position)
+
+    kept = []
+    repeats = set()
+    trivia_scopes = set()
+    for position in range(len(commands) - 1, -1, -1):
+        command = commands[position]
+        scope = command.sender_id if per_user else None
+        key = (command.sender_id, command.cmd, tuple(command.args))
+        if key in repeats:
+            continue
+        if command.cmd in TRIVIA_START_COMMANDS:
+            if scope in trivia_scopes:
+                continue
+            trivia_scopes.add(scope)
+        elif command.cmd in TRIVIA_REPLY_COMMANDS:
+            if first_trivia.get(scope, position) < position or not has_open_question(command.sender_id):
+                continue
+        repeats.add(key)
+        kept.append(command)
+    kept = kept[:limit]
+    kept.reverse()
+    return kept, len(commands) - len(kept)
+
+# --- Batched Reply ---
+
+def pack_replies(replies, limit):
+    """
+    Joins replies into as few messages as possible, each at most `limit`
+    characters; a reply longer than that is sent on its own.
+    """
+    messages = []
+    for reply in replies:
+        if messages and len(messages[-1]) + 2 + len(reply) <= limit:
+            messages[-1] += "\n\n" + reply
+        else:
+            messages.append(reply)
+    return messages
@@ -0,0 +1,133 @@
+import importlib.util
+import os
+import threading
+import time
+
+# --- File Paths ---
+# Every .py file in this directory is imported at startup, so it can register
+# new commands with @command without touching bot.py.
+PLUGINS_DIR = "plugins"
+
+# User IDs allowed to run commands registered with admin_only=True.
+ADMIN_USER_IDS = {uid.strip() for uid in os.getenv("ADMIN_USER_IDS", "").split(",") if uid.strip()}
+
+# --- Registry ---
+
+class Command:
+    """A registered command and the metadata the dispatcher uses to run it."""
+
+    def __init__(self, name, handler, needs_username=True, needs_membership=False,
+                 cooldown=0, usage=None, help=None, admin_only=False):
+        self.name = name
+        self.handler = handler
+        self.needs_username = needs_username
+        self.needs_membership = needs_membership
+        self.cooldown = cooldown  # Seconds between two uses in the same chat
+        self.usage = usage        # If set, the command needs arguments; shown when they're missing
+        self.help = help
+        self.admin_only = admin_only
+        self.module = handler.__module__
+
+registry = {}  # { "!name": Command }
+
+def command(name, *aliases, needs_username=True, needs_membership=False, cooldown=0, usage=None,
+            help=None, admin_only=False):
+    """
+    Registers the decorated function as the handler for `name` (and any aliases).
+    The handler receives a CommandContext and returns the reply text.
+    """
+    def decorator(handler):
+        cmd = Command(name, handler, needs_username, needs_membership, cooldown, usage, help, admin_only)
+        for key in (name,) + aliases:
+            registry[key.lower()] = cmd
+        return handler
+    return decorator
+
+# --- Context ---
+
+class CommandContext:
+    """
+    Everything a handler needs about one incoming command. The username and the
+    member list are resolved lazily, so commands that don't use them never pay
+    for the API calls.
+    """
+
+    def __init__(self, client, thread_id, user_id, command, args, state,
+                 resolve_username, resolve_members):
+        self.client = client
+        self.thread_id = str(thread_id)
+        self.user_id = str(user_id)
+        self.command = command
+        self.args = args
+        self.state = state
+        self._resolve_username = resolve_username
+        self._resolve_members = resolve_members
+        self._username = None
+        self._members = None
+
+    @property
+    def username(self):
+        if self._username is None:
+            self._username = self._resolve_username(self.client, self.user_id)
+        return self._username
+
+    @property
+    def members(self):
+        if self._members is None:
+            self._members = self._resolve_members(self.client, self.thread_id)
+        return self._members
+
+# --- Dispatch ---
+
+_last_used = {}  # { (thread_id, command name): monotonic time of last use }
+_cooldown_lock = threading.Lock()
+
+def dispatch(ctx):
+    """
+    Runs the handler registered for ctx.command. Returns its reply, or None if
+    no such command is registered.
+    """
+    cmd = registry.get(ctx.command)
+    if cmd is None:
+        return None
+
+    if cmd.admin_only and ctx.user_id not in ADMIN_USER_IDS:
+        return "🚫 This command is for admins only."
+
+    if cmd.usage and not ctx.args:
+        return f"Usage: {cmd.usage}"
+
+    if cmd.cooldown:
+        key = (ctx.thread_id, cmd.name)
+        now = time.monotonic()
+        with _cooldown_lock:
+            remaining = cmd.cooldown - (now - _last_used.get(key, float("-inf")))
+            if remaining > 0:
+                return f"⏳ {cmd.name} is cooling down, try again in {int(remaining) + 1}s."
+            _last_used[key] = now
+
+    if cmd.needs_username:
+        ctx.username
+    if cmd.needs_membership:
+        ctx.members
+    return cmd.handler(ctx)
+
+# --- Plugins ---
+
+def load_plugins(directory=PLUGINS_DIR):
+    """Imports every plugin module in `directory`. Returns the names of the loaded plugins."""
+    loaded = []
+    if not os.path.isdir(directory):
+        return loaded
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith(".py") or filename.startswith("_"):
+            continue
+        module_name = f"plugins.{filename[:-3]}"
+        try:
+            spec = importlib.util.spec_from_file_location(module_name, os.path.join(directory, filename))
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            loaded.append(filename[:-3])
+        except Exception as e:
+            print(f"Error loading plugin {filename}: {e}")
+    return loaded
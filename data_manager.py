@@ -1,17 +1,46 @@
+import atexit
+import heapq
 import json
 import os
-from datetime import datetime
+import threading
+import time
+import leaderboard
+import packs
+from birthdays import BirthdayCalendar, keys_for_day
 
 # --- File Paths ---
 LISTS_DIR = "lists"
+PACKS_DIR = os.path.join(LISTS_DIR, "packs")
 DATA_DIR = "data"
 SCORES_FILE = os.path.join(DATA_DIR, "scores.json")
 BIRTHDAYS_FILE = os.path.join(DATA_DIR, "birthdays.json")
 CUSTOM_COMMANDS_FILE = os.path.join(DATA_DIR, "custom_commands.json")
+SCORES_JOURNAL_FILE = os.path.join(DATA_DIR, "scores.journal")
+DB_FILE = os.path.join(DATA_DIR, "bot.db")
+
+# Set by supervisor.py for each worker process. Files holding one process's
+# own state (cursors, decks, caches) then live in STATE_DIR, apart per worker,
+# while scores, birthdays and custom commands are shared through DB_FILE.
+WORKER_ID = os.getenv("BOT_WORKER_ID", "")
+STATE_DIR = os.path.join(DATA_DIR, "workers", WORKER_ID) if WORKER_ID else DATA_DIR
+
+# "json" (default) keeps data in the JSON files above; "sqlite" uses DB_FILE.
+# Worker processes always use SQLite, which is safe to share between processes.
+STORAGE_BACKEND = "sqlite" if WORKER_ID else os.getenv("STORAGE_BACKEND", "json").lower()
+
+# How often (in seconds) a cached list file is re-checked for changes on disk.
+CONTENT_CHECK_INTERVAL = float(os.getenv("CONTENT_CHECK_INTERVAL", "1"))
+# How often (in seconds) buffered score changes are appended to the journal.
+SCORE_FLUSH_INTERVAL = float(os.getenv("SCORE_FLUSH_INTERVAL", "5"))
+# Number of journal entries after which the journal is compacted into scores.json.
+SCORE_COMPACT_THRESHOLD = int(os.getenv("SCORE_COMPACT_THRESHOLD", "500"))
+# How often (in seconds) the SQLite database is checked for commits by other processes.
+SHARED_CHECK_INTERVAL = float(os.getenv("SHARED_CHECK_INTERVAL", "1"))
 
 # --- Ensure directories exist ---
 os.makedirs(LISTS_DIR, exist_ok=True)
 os.makedirs(DATA_DIR, exist_ok=True)
+os.makedirs(STATE_DIR, exist_ok=True)
 
 # --- Generic JSON Handlers ---
 
@@ -29,110 +58,533 @@ def load_json(filepath, default_value):
         return default_value
 
 def save_json(filepath, data):
-    """Saves data to a JSON file."""
+    """
+    Saves data to a JSON file. The file is replaced atomically so a crash can't truncate it.
+    Returns True on success.
+    """
+    tmp_path = filepath + ".tmp"
     try:
-        with open(filepath, 'w', encoding='utf-8') as f:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
             json.dump(data, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, filepath)
+        return True
     except Exception as e:
         print(f"Error saving JSON to {filepath}: {e}")
+        return False
 
-# --- List Functions ---
+# --- Storage Backend ---
 
-def load_list(filename):
-    """Loads a list of items from a text file in the 'lists' directory."""
-    filepath = os.path.join(LISTS_DIR, filename)
-    if not os.path.exists(filepath):
-        return []
+_sqlite_store = None
+_backend_lock = threading.Lock()
+
+def _sqlite():
+    """Returns the SQLite store when STORAGE_BACKEND is 'sqlite', otherwise None."""
+    global _sqlite_store
+    if STORAGE_BACKEND != "sqlite":
+        return None
+    if _sqlite_store is None:
+        with _backend_lock:
+            if _sqlite_store is None:
+                import sqlite_store
+                store = sqlite_store.SQLiteStore(DB_FILE)
+                # One-time import of the existing JSON files into the database
+                with _scores_lock:
+                    _ensure_scores_loaded()
+                    json_scores = dict(_scores)
+                if store.migrate_from_json(json_scores, load_json(BIRTHDAYS_FILE, {}), load_json(CUSTOM_COMMANDS_FILE, {})):
+                    print(f"Migrated JSON data files into {DB_FILE}.")
+                _sqlite_store = store
+    return _sqlite_store
+
+_data_version = None
+_data_version_checked = 0.0
+
+def _sync_shared_state():
+    """
+    Drops the in-memory copies of SQLite data (custom commands, leaderboard
+    rows) once another process has committed, e.g. another worker. This
+    process's own writes don't count: they already updated those copies.
+    The check is one PRAGMA, throttled to once per SHARED_CHECK_INTERVAL.
+    """
+    global _data_version, _data_version_checked
+    store = _sqlite()
+    if not store:
+        return
+    now = time.monotonic()
+    if now - _data_version_checked < SHARED_CHECK_INTERVAL:
+        return
+    _data_version_checked = now
+    version = store.data_version()
+    if version == _data_version:
+        return
+    _data_version = version
+    invalidate_custom_commands()
+    with _scores_lock:
+        for board in _boards.values():
+            board.stale = True
+
+# --- Content Catalog ---
+# Files in 'lists' are parsed once and kept in memory. Each entry remembers the
+# file's (mtime, size) so an edited file is picked up on the next access, and
+# that stat() call itself is throttled to once per CONTENT_CHECK_INTERVAL.
+# A compiled pack in PACKS_DIR (see packs.py) built from the current version of
+# a file is served in its place: a memory-mapped, list-like ContentPack.
+
+_content_cache = {}  # { filepath: {"sig": (mtime_ns, size), "checked": float, "data": ...} }
+_content_lock = threading.Lock()
+_content_stats = {"hits": 0, "loads": 0}
+
+def _file_signature(filepath):
+    """Returns a cheap (mtime, size) signature for a file, or None if it is missing."""
+    try:
+        st = os.stat(filepath)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+def _read_text_list(filepath):
+    """Reads a text file into a list of its non-empty, stripped lines."""
     try:
         with open(filepath, 'r', encoding='utf-8') as f:
             return [line.strip() for line in f if line.strip()]
     except Exception as e:
-        print(f"Error loading list {filename}: {e}")
+        print(f"Error loading list {os.path.basename(filepath)}: {e}")
         return []
 
+def _read_json_list(filepath):
+    """Reads a JSON file from the 'lists' directory."""
+    return load_json(filepath, [])
+
+def _open_pack(pack_path, source_sig):
+    """Opens a content pack, or returns None if it is invalid or older than its source file."""
+    try:
+        pack = packs.ContentPack(pack_path)
+    except (OSError, ValueError, packs.PackError) as e:
+        print(f"Error opening content pack {pack_path}: {e}")
+        return None
+    if source_sig is not None and tuple(pack.metadata.get("source_sig") or ()) != source_sig:
+        print(f"Content pack {pack_path} is out of date; run 'python packs.py' to rebuild it.")
+        pack.close()
+        return None
+    return pack
+
+def get_cached_content(filepath, loader, pack_path=None):
+    """
+    Returns the parsed contents of a file, re-parsing it with `loader` only when
+    the file changed on disk. If `pack_path` is an up-to-date pack of the file,
+    the pack is returned instead. The returned object is shared; treat it as read-only.
+    """
+    now = time.monotonic()
+    entry = _content_cache.get(filepath)
+    if entry and now - entry["checked"] < CONTENT_CHECK_INTERVAL:
+        _content_stats["hits"] += 1
+        return entry["data"]
+
+    with _content_lock:
+        entry = _content_cache.get(filepath)
+        source_sig = _file_signature(filepath)
+        pack_sig = _file_signature(pack_path) if pack_path else None
+        if source_sig is None and pack_sig is None:
+            _content_cache.pop(filepath, None)
+            return []
+        sig = (source_sig, pack_sig)
+        if entry and entry["sig"] == sig:
+            entry["checked"] = now
+            _content_stats["hits"] += 1
+            return entry["data"]
+        _content_stats["loads"] += 1
+        data = _open_pack(pack_path, source_sig) if pack_sig else None
+        if data is None:
+            data = loader(filepath) if source_sig else []
+        _content_cache[filepath] = {"sig": sig, "checked": now, "data": data}
+        return data
+
+def get_content_cache_stats():
+    """Returns how often list files were served from memory ("hits") vs. parsed ("loads")."""
+    return dict(_content_stats)
+
+# --- List Functions ---
+
+def load_list(filename):
+    """Loads a list of items from a text file in the 'lists' directory."""
+    filepath = os.path.join(LISTS_DIR, filename)
+    return get_cached_content(filepath, _read_text_list, os.path.join(PACKS_DIR, packs.pack_filename(filename)))
+
 def load_json_from_lists(filename):
     """Loads a JSON file from the 'lists' directory."""
     filepath = os.path.join(LISTS_DIR, filename)
-    return load_json(filepath, [])
+    return get_cached_content(filepath, _read_json_list, os.path.join(PACKS_DIR, packs.pack_filename(filename)))
+
+def _list_filenames():
+    """Names of the lists available, from the source files and from packs shipped without them."""
+    filenames = set()
+    if os.path.isdir(LISTS_DIR):
+        filenames.update(f for f in os.listdir(LISTS_DIR) if f.endswith(packs.SOURCE_EXTENSIONS))
+    if os.path.isdir(PACKS_DIR):
+        sources = {packs.pack_filename(f) for f in filenames}
+        for pack_name in os.listdir(PACKS_DIR):
+            if pack_name.endswith(packs.PACK_EXTENSION) and pack_name not in sources:
+                try:
+                    filenames.add(packs.source_filename(os.path.join(PACKS_DIR, pack_name)))
+                except (OSError, packs.PackError):
+                    continue
+    return sorted(filenames)
 
 def get_list_file_details():
-    """Gets the names and line counts of files in the 'lists' directory."""
+    """
+    Gets the names and item counts of files in the 'lists' directory. Lists
+    with a pack are counted from its header, without reading any items.
+    """
     files_details = []
     try:
-        for filename in os.listdir(LISTS_DIR):
-            filepath = os.path.join(LISTS_DIR, filename)
-            count = 0
+        for filename in _list_filenames():
             if filename.endswith('.txt'):
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    count = len([line for line in f if line.strip()])
+                count = len(load_list(filename))
                 files_details.append(f"• {filename} ({count} items)")
             elif filename.endswith('.json'):
-                data = load_json(filepath, [])
-                count = len(data)
+                count = len(load_json_from_lists(filename))
                 files_details.append(f"• {filename} ({count} items)")
     except Exception as e:
         print(f"Error getting file details: {e}")
     return files_details
 
 # --- Score Functions ---
+# Scores are kept in memory. add_score only buffers the change; a background
+# timer appends buffered changes to scores.journal (one JSON line each), and
+# once the journal grows past SCORE_COMPACT_THRESHOLD it is folded into the
+# scores.json snapshot. Every journal entry carries a sequence number and the
+# snapshot records the last one it contains, so replaying after a crash at any
+# point never counts a change twice.
+#
+# Points are also summed per day and per week (see leaderboard.PERIODS); only
+# the current bucket of each is kept. Every board keeps its top rows in a
+# leaderboard.TopK that add_score updates, so !leaderboard never sorts all users.
+
+_scores = None          # { user_id: points }, loaded lazily
+_scores_seq = 0         # sequence number of the last change applied to _scores
+_pending_scores = []    # [(seq, user_id, points, timestamp)] not yet written to the journal
+_period_scores = {}     # { period: { user_id: points } } for the current bucket of each period
+_period_buckets = {}    # { period: current bucket key, e.g. "2026-W42" }
+_boards = {period: leaderboard.TopK() for period in ("all",) + leaderboard.PERIODS}
+_journal_entries = 0    # entries currently in scores.journal
+_scores_lock = threading.RLock()
+_flusher_thread = None
+
+def _read_scores_snapshot():
+    """
+    Reads scores.json, accepting both the plain and the sequence-stamped format.
+    Returns (scores, seq, { bucket key: { user_id: points } }).
+    """
+    data = load_json(SCORES_FILE, {})
+    if isinstance(data, dict) and isinstance(data.get("scores"), dict) and "seq" in data:
+        return data["scores"], data["seq"], data.get("periods", {})
+    return data if isinstance(data, dict) else {}, 0, {}
+
+def _ensure_scores_loaded():
+    """Builds the in-memory scores from the snapshot plus any newer journal entries."""
+    global _scores, _scores_seq, _journal_entries, _period_scores, _period_buckets
+    if _scores is not None:
+        return
+    scores, seq, periods = _read_scores_snapshot()
+    buckets = leaderboard.period_keys()
+    period_scores = {period: dict(periods.get(buckets[period], {})) for period in leaderboard.PERIODS}
+    entries = 0
+    if os.path.exists(SCORES_JOURNAL_FILE):
+        with open(SCORES_JOURNAL_FILE, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # A torn final line from a crash mid-append
+                entries += 1
+                if entry["s"] <= seq:
+                    continue
+                scores[entry["u"]] = scores.get(entry["u"], 0) + entry["p"]
+                seq = entry["s"]
+                if "t" in entry:
+                    entry_buckets = leaderboard.period_keys(entry["t"])
+                    for period, bucket in period_scores.items():
+                        if entry_buckets[period] == buckets[period]:
+                            bucket[entry["u"]] = bucket.get(entry["u"], 0) + entry["p"]
+    _scores, _scores_seq, _journal_entries = scores, seq, entries
+    _period_scores, _period_buckets = period_scores, buckets
 
 def load_scores():
-    """Loads the scores dictionary from scores.json."""
-    return load_json(SCORES_FILE, {})
+    """Returns a copy of the scores dictionary."""
+    store = _sqlite()
+    if store:
+        return store.load_scores()
+    with _scores_lock:
+        _ensure_scores_loaded()
+        return dict(_scores)
 
 def add_score(user_id, points=1):
-    """Adds points to a user's score."""
-    scores = load_scores()
+    """Adds points to a user's score. The change is persisted by the next flush."""
+    global _scores_seq
     user_id = str(user_id)
-    if user_id not in scores:
-        scores[user_id] = 0
-    scores[user_id] += points
-    save_json(SCORES_FILE, scores)
+    now = time.time()
+    store = _sqlite()
+    with _scores_lock:
+        _prepare_boards(now)
+        if store:
+            total, period_totals = store.add_score(
+                user_id, points, [_period_buckets[period] for period in leaderboard.PERIODS]
+            )
+            period_totals = dict(zip(leaderboard.PERIODS, period_totals))
+        else:
+            total = _scores[user_id] = _scores.get(user_id, 0) + points
+            period_totals = {}
+            for period in leaderboard.PERIODS:
+                bucket = _period_scores[period]
+                period_totals[period] = bucket[user_id] = bucket.get(user_id, 0) + points
+            _scores_seq += 1
+            _pending_scores.append((_scores_seq, user_id, points, int(now)))
+        _boards["all"].update(user_id, total)
+        for period, period_total in period_totals.items():
+            _boards[period].update(user_id, period_total)
+
+def flush_scores():
+    """Appends buffered score changes to the journal, compacting it when it gets long."""
+    global _journal_entries
+    with _scores_lock:
+        if not _pending_scores:
+            return
+        lines = "".join(json.dumps({"s": seq, "u": uid, "p": pts, "t": ts}) + "\n" for seq, uid, pts, ts in _pending_scores)
+        try:
+            with open(SCORES_JOURNAL_FILE, 'a', encoding='utf-8') as f:
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+        except Exception as e:
+            print(f"Error writing score journal: {e}")
+            return
+        _journal_entries += len(_pending_scores)
+        _pending_scores.clear()
+        if _journal_entries >= SCORE_COMPACT_THRESHOLD:
+            compact_scores()
+
+def compact_scores():
+    """Writes a full scores.json snapshot (including buffered changes) and empties the journal."""
+    global _journal_entries
+    with _scores_lock:
+        _ensure_scores_loaded()
+        periods = {_period_buckets[period]: _period_scores[period] for period in leaderboard.PERIODS}
+        if not save_json(SCORES_FILE, {"seq": _scores_seq, "scores": _scores, "periods": periods}):
+            return
+        _pending_scores.clear()
+        try:
+            with open(SCORES_JOURNAL_FILE, 'w', encoding='utf-8'):
+                pass
+            _journal_entries = 0
+        except Exception as e:
+            print(f"Error truncating score journal: {e}")
 
-def get_leaderboard():
-    """Gets the scores, sorted from highest to lowest."""
-    scores = load_scores()
-    sorted_scores = sorted(scores.items(), key=lambda item: item[1], reverse=True)
-    return sorted_scores
+def _flush_loop():
+    while True:
+        time.sleep(SCORE_FLUSH_INTERVAL)
+        flush_all()
+
+def start_background_flush():
+    """Starts the daemon thread that periodically flushes buffered writes."""
+    global _flusher_thread
+    if _flusher_thread is None:
+        _flusher_thread = threading.Thread(target=_flush_loop, daemon=True)
+        _flusher_thread.start()
+
+def _prepare_boards(now=None):
+    """Loads the scores if needed and starts new day/week buckets once their period has passed."""
+    store = _sqlite()
+    if not store:
+        _ensure_scores_loaded()
+    buckets = leaderboard.period_keys(now)
+    if buckets == _period_buckets:
+        return
+    for period in leaderboard.PERIODS:
+        if _period_buckets.get(period) == buckets[period]:
+            continue
+        if period in _period_buckets:
+            # A new day or week has started, so its board starts out empty
+            _boards[period].clear()
+        else:
+            _boards[period].stale = True
+        _period_buckets[period] = buckets[period]
+        _period_scores[period] = {}
+    if store:
+        store.prune_periods(buckets.values())
+
+def _full_leaderboard(period, limit=None):
+    """Sorts a board's full scores (only the top `limit` if given)."""
+    store = _sqlite()
+    if store:
+        return store.get_leaderboard(limit, None if period == "all" else _period_buckets[period])
+    scores = _scores if period == "all" else _period_scores[period]
+    if limit is not None:
+        return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+def _get_board(period):
+    board = _boards[period]
+    if board.stale:
+        board.rebuild(_full_leaderboard(period, board.k))
+    return board
+
+def get_leaderboard(limit=None, period="all"):
+    """
+    Gets the scores (optionally only the top `limit`), sorted from highest to lowest.
+    `period` is "all", or one of leaderboard.PERIODS for points scored today / this week.
+    """
+    _sync_shared_state()
+    with _scores_lock:
+        _prepare_boards()
+        if limit is not None and limit <= leaderboard.LEADERBOARD_SIZE:
+            return _get_board(period).rows()[:limit]
+        return _full_leaderboard(period, limit)
+
+def get_leaderboard_version(period="all"):
+    """Returns a number that changes whenever the top rows of a board change."""
+    _sync_shared_state()
+    with _scores_lock:
+        _prepare_boards()
+        return _get_board(period).version
 
 # --- Birthday Functions ---
+# Birthdays are loaded once into a BirthdayCalendar, which keeps them indexed
+# by month-day as they are set (the SQLite backend indexes the same key).
+
+_birthday_calendar = None
+_birthdays_lock = threading.Lock()
+
+def _get_birthday_calendar():
+    global _birthday_calendar
+    if _birthday_calendar is None:
+        _birthday_calendar = BirthdayCalendar(load_json(BIRTHDAYS_FILE, {}))
+    return _birthday_calendar
 
 def load_birthdays():
     """Loads the birthdays dictionary from birthdays.json."""
-    return load_json(BIRTHDAYS_FILE, {})
+    store = _sqlite()
+    if store:
+        return store.load_birthdays()
+    with _birthdays_lock:
+        return _get_birthday_calendar().as_dict()
 
 def set_birthday(user_id, bday_str):
     """Saves a user's birthday."""
-    birthdays = load_birthdays()
-    birthdays[str(user_id)] = bday_str
-    save_json(BIRTHDAYS_FILE, birthdays)
+    store = _sqlite()
+    if store:
+        store.set_birthday(user_id, bday_str)
+        return
+    with _birthdays_lock:
+        calendar = _get_birthday_calendar()
+        calendar.set(user_id, bday_str)
+        save_json(BIRTHDAYS_FILE, calendar.as_dict())
 
 def get_all_birthdays():
     """Gets all saved birthdays, sorted by date."""
-    birthdays = load_birthdays()
-    try:
-        # Sort by month and day
-        sorted_bdays = sorted(birthdays.items(), key=lambda item: datetime.strptime(item[1], '%d-%m').strftime('%m-%d'))
-        return dict(sorted_bdays)
-    except Exception as e:
-        print(f"Error sorting birthdays: {e}")
-        return birthdays # Return unsorted if an error occurs
+    store = _sqlite()
+    if store:
+        return store.get_all_birthdays()
+    with _birthdays_lock:
+        return _get_birthday_calendar().as_dict()
+
+def get_upcoming_birthdays(limit, today=None):
+    """Gets the next `limit` birthdays as (user_id, bday) pairs, starting from today."""
+    store = _sqlite()
+    if store:
+        return store.get_upcoming_birthdays(keys_for_day(today)[0], limit)
+    with _birthdays_lock:
+        return _get_birthday_calendar().upcoming(limit, today)
+
+def get_birthdays_on(day=None):
+    """Gets the (user_id, bday) pairs celebrating on `day` (default: today)."""
+    store = _sqlite()
+    if store:
+        return store.get_birthdays_on(keys_for_day(day))
+    with _birthdays_lock:
+        return _get_birthday_calendar().on(keys_for_day(day))
 
 # --- Custom Command Functions ---
+# Custom commands are served from an in-memory copy that is loaded once and
+# replaced whenever a command is added or the set is saved.
+
+_custom_commands = None
+_custom_commands_lock = threading.Lock()
+
+def _get_custom_commands_map():
+    global _custom_commands
+    _sync_shared_state()
+    commands = _custom_commands
+    if commands is None:
+        with _custom_commands_lock:
+            if _custom_commands is None:
+                store = _sqlite()
+                _custom_commands = store.load_custom_commands() if store else load_json(CUSTOM_COMMANDS_FILE, {})
+            commands = _custom_commands
+    return commands
+
+def invalidate_custom_commands():
+    """Drops the in-memory copy so the next lookup reloads it from storage."""
+    global _custom_commands
+    with _custom_commands_lock:
+        _custom_commands = None
 
 def load_custom_commands():
     """Loads the custom commands dictionary from custom_commands.json."""
-    return load_json(CUSTOM_COMMANDS_FILE, {})
+    return dict(_get_custom_commands_map())
 
 def save_custom_commands(commands_data):
     """Saves the custom commands dictionary to custom_commands.json."""
-    save_json(CUSTOM_COMMANDS_FILE, commands_data)
+    global _custom_commands
+    store = _sqlite()
+    if store:
+        store.save_custom_commands(commands_data)
+    else:
+        save_json(CUSTOM_COMMANDS_FILE, commands_data)
+    with _custom_commands_lock:
+        _custom_commands = dict(commands_data)
 
-def get_custom_command(command):
-    """
-    Loads all custom commands and returns the response for a specific command.
-    This is the missing function your bot.py file needs.
-    """
+def set_custom_command(command, response):
+    """Adds or replaces a single custom command."""
+    global _custom_commands
+    store = _sqlite()
+    if store:
+        store.set_custom_command(command, response)
+        with _custom_commands_lock:
+            if _custom_commands is not None:
+                _custom_commands = {**_custom_commands, command: response}
+        return
     commands = load_custom_commands()
-    return commands.get(command)
+    commands[command] = response
+    save_custom_commands(commands)
+
+def get_custom_command(command):
+    """Returns the response for a specific custom command, or None."""
+    return _get_custom_commands_map().get(command)
+
+def get_custom_commands_map():
+    """Returns the in-memory { command: response } map. It is replaced, never changed, when commands change; treat it as read-only."""
+    return _get_custom_commands_map()
+
+# --- Shutdown ---
+
+# Other modules' write-behind caches, flushed on the same timer and at exit.
+_flush_hooks = []
+_flush_lock = threading.Lock()  # The background flush and a shutdown flush never overlap
+
+def register_flush_hook(flush_fn):
+    """Adds a function to run on every periodic flush and at shutdown."""
+    if flush_fn not in _flush_hooks:
+        _flush_hooks.append(flush_fn)
+
+def flush_all():
+    """Persists every buffered write. Call before the process exits."""
+    with _flush_lock:
+        for flush_fn in [flush_scores] + _flush_hooks:
+            try:
+                flush_fn()
+            except Exception as e:
+                print(f"Error during flush ({getattr(flush_fn, '__qualname__', flush_fn)}): {e}")
 
+atexit.register(flush_all)
@@ -0,0 +1,112 @@
+import os
+import random
+import threading
+from collections import OrderedDict
+import data_manager as dm
+
+# --- File Paths ---
+DECKS_FILE = os.path.join(dm.STATE_DIR, "decks.json")
+
+# --- Settings ---
+# Decks for filtered draws (e.g. !truth <keyword>) are named after whatever the
+# users typed, so they are kept in memory only, and only the most recently used.
+MAX_FILTERED_DECKS = int(os.getenv("MAX_FILTERED_DECKS", "256"))
+
+# --- Deck ---
+
+class Deck:
+    """
+    A shuffled order of the indices 0..size-1 that is dealt one card at a time.
+    Only the seed and position are persisted; the order is rebuilt from the seed.
+    """
+
+    def __init__(self, size, seed=None, position=0):
+        self.size = size
+        self.seed = seed if seed is not None else random.getrandbits(64)
+        self.position = position
+        self._order = None
+
+    def _shuffled_order(self):
+        if self._order is None:
+            order = list(range(self.size))
+            random.Random(self.seed).shuffle(order)
+            self._order = order
+        return self._order
+
+    def reshuffle(self):
+        """Starts a fresh pass over the deck with a new random order."""
+        self.seed = random.getrandbits(64)
+        self.position = 0
+        self._order = None
+
+    def draw(self):
+        """Deals the next index. Returns (index, reshuffled)."""
+        reshuffled = False
+        if self.position >= self.size:
+            self.reshuffle()
+            reshuffled = True
+        index = self._shuffled_order()[self.position]
+        self.position += 1
+        return index, reshuffled
+
+    def to_dict(self):
+        return {"size": self.size, "seed": self.seed, "position": self.position}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["size"], seed=data["seed"], position=data["position"])
+
+# --- Deck Store ---
+# Draws only change memory; the positions are checkpointed to decks.json by
+# the periodic flush and at shutdown (see data_manager.register_flush_hook).
+
+_decks = None
+_decks_dirty = False
+_filtered_decks = OrderedDict()  # { name: Deck }, least recently used first
+_lock = threading.Lock()
+
+def _load_decks():
+    """Loads saved deck positions from decks.json (once per process)."""
+    global _decks
+    if _decks is None:
+        _decks = {}
+        for name, data in dm.load_json(DECKS_FILE, {}).items():
+            try:
+                _decks[name] = Deck.from_dict(data)
+            except (KeyError, TypeError):
+                continue
+    return _decks
+
+def save_decks():
+    """Checkpoints every deck's seed and position to decks.json, if any changed since the last save."""
+    global _decks_dirty
+    with _lock:
+        if not _decks_dirty:
+            return
+        data = {name: deck.to_dict() for name, deck in _load_decks().items()}
+        _decks_dirty = False
+    dm.save_json(DECKS_FILE, data)
+
+dm.register_flush_hook(save_decks)
+
+def draw(name, size, filtered=False):
+    """
+    Draws the next index for the deck called `name` over a list of `size` items.
+    A new deck is dealt if the list changed size. A `filtered` deck is not saved
+    and is dropped once MAX_FILTERED_DECKS newer ones were used. Returns (index, reshuffled).
+    """
+    global _decks_dirty
+    with _lock:
+        decks = _filtered_decks if filtered else _load_decks()
+        deck = decks.get(name)
+        if deck is None or deck.size != size:
+            deck = Deck(size)
+            decks[name] = deck
+        index, reshuffled = deck.draw()
+        if filtered:
+            _filtered_decks.move_to_end(name)
+            while len(_filtered_decks) > MAX_FILTERED_DECKS:
+                _filtered_decks.popitem(last=False)
+        else:
+            _decks_dirty = True
+    return index, reshuffled
@@ -0,0 +1,139 @@
+# An offline stand-in for instagrapi's Client, used by benchmark.py.
+# It implements the calls the bot makes (direct_thread, direct_messages,
+# direct_send, user_info_v1, user_info) against in-memory chats, with
+# configurable latency and error injection, and counts every call by endpoint.
+import itertools
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+# --- Data Objects ---
+# Only the attributes the bot reads are modelled.
+
+class FakeUser:
+    def __init__(self, pk, username):
+        self.pk = str(pk)
+        self.username = username
+
+class FakeMessage:
+    def __init__(self, message_id, user_id, text, item_type="text"):
+        self.id = str(message_id)
+        self.user_id = str(user_id)
+        self.text = text
+        self.item_type = item_type
+        self.timestamp = datetime.now(timezone.utc)
+
+class FakeThread:
+    def __init__(self, thread_id, users, messages):
+        self.id = str(thread_id)
+        self.users = users
+        self.messages = messages
+
+class FakeClientError(Exception):
+    """Raised for injected failures, in place of instagrapi's ClientError."""
+
+# --- Client ---
+
+class FakeInstagramClient:
+    """
+    latency:     seconds added to every API call
+    jitter:      extra random latency, uniform in [0, jitter]
+    error_rate:  probability that a call raises FakeClientError
+    endpoint_errors / endpoint_latency: per-endpoint overrides, e.g. {"user_info_v1": 0.5}
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, endpoint_errors=None,
+                 endpoint_latency=None, bot_user_id="1", seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.endpoint_errors = endpoint_errors or {}
+        self.endpoint_latency = endpoint_latency or {}
+        self.bot_user_id = str(bot_user_id)
+        self.calls = Counter()
+        self.sent = []  # [(monotonic time, thread_id, text)]
+        self._threads = {}  # { thread_id: {"users": [...], "messages": [... oldest first]} }
+        self._usernames = {}
+        self._ids = itertools.count(1)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    # --- Setup ---
+
+    def add_user(self, user_id, username=None):
+        user_id = str(user_id)
+        self._usernames[user_id] = username or f"user{user_id}"
+        return FakeUser(user_id, self._usernames[user_id])
+
+    def add_thread(self, thread_id, user_ids):
+        users = []
+        for user_id in user_ids:
+            if str(user_id) not in self._usernames:
+                self.add_user(user_id)
+            users.append(FakeUser(user_id, self._usernames[str(user_id)]))
+        with self._lock:
+            self._threads[str(thread_id)] = {"users": users, "messages": []}
+
+    def post_message(self, thread_id, user_id, text, item_type="text"):
+        """Adds a message to a chat as if a member sent it. Returns the message."""
+        with self._lock:
+            message = FakeMessage(next(self._ids), user_id, text, item_type)
+            self._threads[str(thread_id)]["messages"].append(message)
+        return message
+
+    # --- Simulated API ---
+
+    def _call(self, endpoint):
+        with self._lock:
+            self.calls[endpoint] += 1
+            delay = self.endpoint_latency.get(endpoint, self.latency)
+            if self.jitter:
+                delay += self._random.uniform(0, self.jitter)
+            fail = self._random.random() < self.endpoint_errors.get(endpoint, self.error_rate)
+        if delay:
+            time.sleep(delay)
+        if fail:
+            raise FakeClientError(f"Injected failure in {endpoint}")
+
+    def direct_thread(self, thread_id, amount=20):
+        self._call("direct_thread")
+        with self._lock:
+            chat = self._threads[str(thread_id)]
+            # instagrapi returns the newest message first
+            messages = list(reversed(chat["messages"][-amount:])) if amount else []
+            return FakeThread(thread_id, list(chat["users"]), messages)
+
+    def direct_messages(self, thread_id, amount=20):
+        self._call("direct_messages")
+        with self._lock:
+            return list(reversed(self._threads[str(thread_id)]["messages"][-amount:]))
+
+    def direct_send(self, text, thread_ids=None, user_ids=None):
+        self._call("direct_send")
+        for thread_id in thread_ids or []:
+            with self._lock:
+                message = FakeMessage(next(self._ids), self.bot_user_id, text)
+                self._threads[str(thread_id)]["messages"].append(message)
+                self.sent.append((time.monotonic(), str(thread_id), text))
+        return True
+
+    def user_info_v1(self, user_id):
+        self._call("user_info_v1")
+        return self._lookup_user(user_id)
+
+    def user_info(self, user_id):
+        self._call("user_info")
+        return self._lookup_user(user_id)
+
+    def _lookup_user(self, user_id):
+        username = self._usernames.get(str(user_id))
+        if username is None:
+            raise FakeClientError(f"User {user_id} not found")
+        return FakeUser(user_id, username)
+
+    def api_calls(self):
+        """Total number of simulated API calls so far."""
+        with self._lock:
+            return sum(self.calls.values())
@@ -0,0 +1,97 @@
+import threading
+from itertools import combinations
+
+# --- Edit Distance ---
+
+def edit_distance(a, b):
+    """
+    Insertions, deletions, substitutions and swaps of two adjacent characters
+    needed to turn `a` into `b` (so '!truht' is one edit away from '!truth').
+    """
+    previous_row = None
+    row = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        before, previous_row, row = previous_row, row, [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            row[j] = min(previous_row[j] + 1, row[j - 1] + 1, previous_row[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                row[j] = min(row[j], before[j - 2] + 1)
+    return row[-1]
+
+def deletions(word, max_deletes):
+    """Every string obtained by deleting up to `max_deletes` characters from `word` (including `word`)."""
+    variants = {word}
+    for count in range(1, min(max_deletes, len(word)) + 1):
+        for positions in combinations(range(len(word)), count):
+            variants.add("".join(char for i, char in enumerate(word) if i not in positions))
+    return variants
+
+# --- Command Names ---
+
+class CommandIndex:
+    """
+    Command names from several sources (e.g. the registry and the custom
+    commands), indexed for typo lookups by their deletion neighbourhoods: two
+    names within `max_distance` edits share a string reachable from both by
+    at most that many deletions. A lookup only generates the query's own
+    deletions and checks the few names filed under them, so it costs the same
+    however many commands there are. A name more than `max_distance`
+    characters longer than every indexed name can't match, so it isn't looked up.
+
+    A source is re-read only when it changed, and then only its new names are
+    indexed. Names are never removed, so matches are checked against `exists`
+    before they are returned.
+    """
+
+    def __init__(self, max_distance=2):
+        self.max_distance = max_distance
+        self._names = set()
+        self._longest = 0  # Length of the longest indexed name
+        self._by_deletion = {}  # { deletion variant: {names} }
+        self._synced = {}       # { source name: (collection last read, its length then) }
+        self._lock = threading.Lock()
+
+    def _add(self, name):
+        if name in self._names:
+            return
+        self._names.add(name)
+        self._longest = max(self._longest, len(name))
+        for variant in deletions(name, self.max_distance):
+            self._by_deletion.setdefault(variant, set()).add(name)
+
+    def add(self, name):
+        with self._lock:
+            self._add(name)
+
+    def sync(self, source, names):
+        """Indexes any names of `names` (the current contents of `source`) that aren't indexed yet."""
+        synced = self._synced.get(source)
+        if synced and synced[0] is names and synced[1] == len(names):
+            return
+        with self._lock:
+            for name in list(names):
+                self._add(name)
+            self._synced[source] = (names, len(names))
+
+    def closest(self, name, max_distance=None, exists=None):
+        """Returns (distance, [names]): the existing names nearest to `name`, sorted, or (None, [])."""
+        max_distance = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        if len(name) - max_distance > self._longest:
+            return None, []
+        candidates = set()
+        with self._lock:
+            for variant in deletions(name, max_distance):
+                candidates.update(self._by_deletion.get(variant, ()))
+        best = None
+        matches = []
+        for candidate in candidates:
+            if candidate == name or (exists and not exists(candidate)):
+                continue
+            d = edit_distance(name, candidate)
+            if d > max_distance or (best is not None and d > best):
+                continue
+            if best is None or d < best:
+                best, matches = d, []
+            matches.append(candidate)
+        return best, sorted(matches)
@@ -0,0 +1,108 @@
+import re
+import threading
+
+# --- Tokens ---
+
+STOP_WORDS = frozenset(
+    "a an and are at be by did do does for from has have how i in is it its me my of on or "
+    "the to was were what when where which who why with you your".split()
+)
+_WORD = re.compile(r"[a-z0-9]+")
+
+def tokenize(text):
+    """Lower-cased words of a text, without stop words, plural 's' and duplicates, in order."""
+    tokens = []
+    for word in _WORD.findall(text.lower().replace("'s", "")):
+        if word in STOP_WORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        if word not in tokens:
+            tokens.append(word)
+    return tokens
+
+def item_text(item):
+    """The searchable text of a list item: a prompt, or a trivia question with its options."""
+    if isinstance(item, dict):
+        parts = [str(item.get("question", ""))]
+        parts.extend(str(option) for option in (item.get("options") or {}).values())
+        return " ".join(parts)
+    return str(item)
+
+# --- Inverted Index ---
+
+class KeywordIndex:
+    """
+    { token: [positions] } over one list, with positions in ascending order.
+    `postings` is a dict, or anything with the same get() (e.g. a pack's PackPostings).
+    """
+
+    def __init__(self, postings, tokens_by_text=None):
+        self.postings = postings
+        self._tokens_by_text = tokens_by_text or {}  # Kept so the next build can reuse them
+
+    @classmethod
+    def build(cls, items, previous=None):
+        """
+        Indexes every item of a list. Items whose text was already tokenized
+        by `previous` (an index of an earlier version of the list) are not
+        tokenized again, so editing a few lines of a big file stays cheap.
+        """
+        known = previous._tokens_by_text if previous else {}
+        tokens_by_text = {}
+        postings = {}
+        for position, item in enumerate(items):
+            text = item_text(item)
+            tokens = tokens_by_text.get(text)
+            if tokens is None:
+                tokens = known.get(text)
+                if tokens is None:
+                    tokens = tokenize(text)
+                tokens_by_text[text] = tokens
+            for token in tokens:
+                postings.setdefault(token, []).append(position)
+        return cls(postings, tokens_by_text)
+
+    def lookup(self, query):
+        """Positions of the items containing every word of `query` (empty if none, or if it has no words)."""
+        lists = [self.postings.get(token) for token in tokenize(query)]
+        if not lists or not all(lists):
+            return []
+        if len(lists) == 1:
+            return lists[0]
+        lists.sort(key=len)
+        matches = set(lists[0])
+        for positions in lists[1:]:
+            matches.intersection_update(positions)
+            if not matches:
+                return []
+        return sorted(matches)
+
+# --- Per-List Indexes ---
+# One index per list name, rebuilt only when the list object changes, i.e.
+# when data_manager reloads the file. Content packs store their postings, so
+# indexing them reads no items at all, and a lookup reads only its tokens' postings.
+
+_indexes = {}  # { name: (list it was built from, KeywordIndex) }
+_lock = threading.Lock()
+
+def index_for(name, items):
+    """Returns the keyword index of `items`, the current contents of the list called `name`."""
+    entry = _indexes.get(name)
+    if entry and entry[0] is items:
+        return entry[1]
+    with _lock:
+        entry = _indexes.get(name)
+        if entry and entry[0] is items:
+            return entry[1]
+        postings = getattr(items, "postings", None)
+        if postings is not None:
+            index = KeywordIndex(postings)
+        else:
+            index = KeywordIndex.build(items, previous=entry[1] if entry else None)
+        _indexes[name] = (items, index)
+        return index
+
+def lookup(name, items, query):
+    """Positions in `items` matching every word of `query`."""
+    return index_for(name, items).lookup(query)
@@ -0,0 +1,90 @@
+import os
+import threading
+from datetime import datetime
+
+# --- Settings ---
+# Number of rows kept ready for each board (and shown by !leaderboard).
+LEADERBOARD_SIZE = int(os.getenv("LEADERBOARD_SIZE", "10"))
+
+# Time-windowed boards, besides the all-time one. Points scored at a given
+# moment count towards the bucket named by period_keys() for each of them.
+PERIODS = ("today", "week")
+
+def period_keys(when=None):
+    """Returns the bucket each time-windowed board uses at `when` (local time), e.g. {"today": "2026-10-17", "week": "2026-W42"}."""
+    if when is None:
+        when = datetime.now()
+    elif not isinstance(when, datetime):
+        when = datetime.fromtimestamp(when)
+    return {"today": when.strftime("%Y-%m-%d"), "week": when.strftime("%G-W%V")}
+
+# --- Top-K ---
+
+class TopK:
+    """
+    The `k` highest scores of a board, kept up to date as single scores change
+    so reading the board never scans every user.
+
+    Every user outside the top has at most the lowest score inside it, so a
+    raised score only has to be compared with that one. Only when a user in a
+    full top drops below it could an outsider overtake them; the board is then
+    marked stale and rebuilt from the full scores on the next read. `version`
+    changes whenever the visible rows do, so rendered text can be cached.
+    """
+
+    def __init__(self, k=LEADERBOARD_SIZE):
+        self.k = k
+        self.version = 0
+        self.stale = True  # Nothing loaded yet
+        self._top = {}     # { user_id: points }, at most k entries
+        self._rows = None  # Sorted copy of _top, built on demand
+        self._lock = threading.Lock()
+
+    def rebuild(self, rows):
+        """Replaces the board with `rows`, the k highest (user_id, points) pairs of the full scores."""
+        with self._lock:
+            top = dict(rows[:self.k])
+            self.stale = False
+            if top == self._top and self.version:
+                return  # Unchanged, so rendered text stays valid
+            self._top = top
+            self._rows = None
+            self.version += 1
+
+    def clear(self):
+        """Empties the board, e.g. when a new day or week starts."""
+        self.rebuild([])
+
+    def update(self, user_id, total):
+        """Records a user's new total score."""
+        with self._lock:
+            if self.stale:
+                return
+            top = self._top
+            if user_id in top:
+                old = top[user_id]
+                if total == old:
+                    return
+                if total < old and len(top) == self.k and total < min(top.values()):
+                    # Someone outside the top may now be ahead of them
+                    self.stale = True
+                    return
+                top[user_id] = total
+            elif len(top) < self.k:
+                # The top isn't full, so it holds every user with a score
+                top[user_id] = total
+            else:
+                lowest = min(top, key=top.get)
+                if total <= top[lowest]:
+                    return
+                del top[lowest]
+                top[user_id] = total
+            self._rows = None
+            self.version += 1
+
+    def rows(self):
+        """Returns the board as (user_id, points) pairs, highest first."""
+        with self._lock:
+            if self._rows is None:
+                self._rows = sorted(self._top.items(), key=lambda item: item[1], reverse=True)
+            return list(self._rows)
@@ -0,0 +1,69 @@
+import os
+import threading
+import time
+
+# --- Settings ---
+# Seconds a chat's member list is served from memory before it is refreshed.
+MEMBERSHIP_TTL = float(os.getenv("MEMBERSHIP_TTL", "300"))
+
+# --- Membership Cache ---
+
+class MembershipCache:
+    """
+    Member lists of group chats, keyed by thread ID.
+
+    Entries are refreshed for free whenever the poll loop fetches a chat. An entry
+    older than the TTL is still served while a background thread re-fetches it;
+    only a chat that was never seen is fetched synchronously.
+    """
+
+    def __init__(self, ttl=MEMBERSHIP_TTL):
+        self.ttl = ttl
+        self._entries = {}  # { thread_id: (users, fetched_at) }
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def update(self, thread_id, users):
+        """Stores the member list seen in a direct_thread response."""
+        if users:
+            with self._lock:
+                self._entries[str(thread_id)] = (list(users), time.monotonic())
+
+    def get(self, client, thread_id):
+        """Returns the members of a chat, calling the API only if it was never cached."""
+        thread_id = str(thread_id)
+        entry = self._entries.get(thread_id)
+        if entry is None:
+            self.misses += 1
+            return self._fetch(client, thread_id)
+
+        self.hits += 1
+        users, fetched_at = entry
+        if time.monotonic() - fetched_at > self.ttl:
+            self._refresh_in_background(client, thread_id)
+        return users
+
+    def _fetch(self, client, thread_id):
+        thread = client.direct_thread(thread_id=thread_id, amount=1)
+        users = list(thread.users) if thread and thread.users else []
+        self.update(thread_id, users)
+        return users
+
+    def _refresh_in_background(self, client, thread_id):
+        with self._lock:
+            if thread_id in self._refreshing:
+                return
+            self._refreshing.add(thread_id)
+
+        def refresh():
+            try:
+                self._fetch(client, thread_id)
+            except Exception as e:
+                print(f"Could not refresh members of {thread_id}: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(thread_id)
+
+        threading.Thread(target=refresh, daemon=True).start()
@@ -0,0 +1,205 @@
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import data_manager as dm
+
+# --- Settings ---
+# Prometheus-style text dump, rewritten on the data_manager flush timer.
+METRICS_FILE = os.getenv("METRICS_FILE", os.path.join(dm.STATE_DIR, "metrics.prom"))
+# If set, /metrics is also served over HTTP on this port (localhost only).
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# --- Metric Types ---
+
+class Histogram:
+    """Cumulative-bucket histogram, as in the Prometheus exposition format."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile (an estimate)."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        running = 0
+        for bound, count in zip(self.buckets, self.counts):
+            running += count
+            if running >= target:
+                return bound
+        return float("inf")
+
+# --- Registry ---
+
+_lock = threading.Lock()
+_counters = {}    # { (name, labels): value }
+_gauges = {}      # { (name, labels): value }
+_histograms = {}  # { (name, labels): Histogram }
+_collectors = []  # Functions called before rendering to refresh gauges
+_help = {}        # { name: help text }
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+def describe(name, help_text):
+    _help[name] = help_text
+
+def inc(name, amount=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+def set_gauge(name, value, **labels):
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+def observe(name, value, **labels):
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram()
+        histogram.observe(value)
+
+def register_collector(collect_fn):
+    """Adds a function that refreshes gauges (e.g. cache hit counts) right before rendering."""
+    if collect_fn not in _collectors:
+        _collectors.append(collect_fn)
+
+def _collect():
+    for collect_fn in _collectors:
+        try:
+            collect_fn()
+        except Exception as e:
+            print(f"Error collecting metrics: {e}")
+
+def counters(name):
+    """Returns { labels dict as tuple: value } for every series of a counter."""
+    with _lock:
+        return {labels: value for (metric, labels), value in _counters.items() if metric == name}
+
+def histograms(name):
+    with _lock:
+        return {labels: histogram for (metric, labels), histogram in _histograms.items() if metric == name}
+
+def gauges(name):
+    with _lock:
+        return {labels: value for (metric, labels), value in _gauges.items() if metric == name}
+
+# --- Rendering ---
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{str(v)}"' for k, v in pairs) + "}"
+
+def render_prometheus():
+    """Renders every metric in the Prometheus text exposition format."""
+    _collect()
+    lines = []
+    with _lock:
+        for kind, series in (("counter", _counters), ("gauge", _gauges)):
+            for name in sorted({name for name, _ in series}):
+                if name in _help:
+                    lines.append(f"# HELP {name} {_help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+                for (metric, labels), value in sorted(series.items()):
+                    if metric == name:
+                        lines.append(f"{name}{_format_labels(labels)} {value}")
+        for name in sorted({name for name, _ in _histograms}):
+            if name in _help:
+                lines.append(f"# HELP {name} {_help[name]}")
+            lines.append(f"# TYPE {name} histogram")
+            for (metric, labels), histogram in sorted(_histograms.items(), key=lambda item: item[0]):
+                if metric != name:
+                    continue
+                running = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    running += count
+                    lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {running}")
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {histogram.count}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+    return "\n".join(lines) + "\n"
+
+def dump_to_file(path=METRICS_FILE):
+    """Writes the current metrics to a text file (atomically)."""
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(render_prometheus())
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"Error writing metrics to {path}: {e}")
+
+# --- HTTP Endpoint ---
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Keep the terminal free for chat output
+
+def start_http_server(port=METRICS_PORT):
+    """Serves /metrics on localhost in a daemon thread. Returns the server, or None if disabled."""
+    if not port:
+        return None
+    server = ThreadingHTTPServer(("127.0.0.1", port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# --- Client Instrumentation ---
+
+INSTRUMENTED_ENDPOINTS = ("direct_thread", "direct_messages", "direct_send", "user_info_v1", "user_info")
+
+def instrument_client(client, endpoints=INSTRUMENTED_ENDPOINTS):
+    """Wraps the client's API methods so every call is counted and timed by endpoint."""
+    for endpoint in endpoints:
+        method = getattr(client, endpoint, None)
+        if method is None or getattr(method, "_instrumented", False):
+            continue
+
+        def wrapper(*args, _method=method, _endpoint=endpoint, **kwargs):
+            started = time.perf_counter()
+            try:
+                return _method(*args, **kwargs)
+            except Exception:
+                inc("ig_api_errors_total", endpoint=_endpoint)
+                raise
+            finally:
+                inc("ig_api_calls_total", endpoint=_endpoint)
+                observe("ig_api_latency_seconds", time.perf_counter() - started, endpoint=_endpoint)
+
+        wrapper._instrumented = True
+        setattr(client, endpoint, wrapper)
+    return client
+
+describe("ig_api_calls_total", "Instagram API calls by endpoint.")
+describe("ig_api_errors_total", "Instagram API calls that raised, by endpoint.")
+describe("ig_api_latency_seconds", "Instagram API call latency by endpoint.")
@@ -0,0 +1,236 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+# --- Settings ---
+# Per chat: sustained messages per second and the burst allowed on top of it.
+OUTBOX_RATE = float(os.getenv("OUTBOX_RATE", "0.5"))
+OUTBOX_BURST = float(os.getenv("OUTBOX_BURST", "3"))
+# Whole account, across all chats.
+OUTBOX_GLOBAL_RATE = float(os.getenv("OUTBOX_GLOBAL_RATE", "1"))
+OUTBOX_GLOBAL_BURST = float(os.getenv("OUTBOX_GLOBAL_BURST", "5"))
+# Queued replies to one chat are merged into a single message up to this length.
+OUTBOX_MAX_MESSAGE_CHARS = int(os.getenv("OUTBOX_MAX_MESSAGE_CHARS", "1000"))
+# After a failed send (e.g. Instagram throttling the account) all sending pauses,
+# starting at OUTBOX_BACKOFF seconds and doubling with each failure in a row up to
+# OUTBOX_BACKOFF_MAX; the message is retried up to OUTBOX_SEND_RETRIES times.
+OUTBOX_BACKOFF = float(os.getenv("OUTBOX_BACKOFF", "5"))
+OUTBOX_BACKOFF_MAX = float(os.getenv("OUTBOX_BACKOFF_MAX", "300"))
+OUTBOX_SEND_RETRIES = int(os.getenv("OUTBOX_SEND_RETRIES", "3"))
+
+# --- Token Bucket ---
+
+class TokenBucket:
+    """Allows `rate` sends per second on average, with bursts of up to `capacity`."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now):
+        """Seconds until one token is available (0 if one is available now)."""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+# --- Outbox ---
+
+class Outbox:
+    """
+    A single outbound send queue drained by one sender thread.
+
+    Replies are computed concurrently, so each command first reserves a ticket in
+    its chat; a finished reply is only released for sending once every earlier
+    ticket of the same chat has completed. Replies within a chat therefore go out
+    in the order the commands arrived, while different chats never wait on each other.
+
+    Sends are paced by a token bucket per chat and one for the whole account. When
+    a chat's bucket is empty its replies pile up, and the backlog is then sent as a
+    single combined message instead of one message per reply.
+
+    A failed send pauses the whole outbox with an increasing back-off and puts the
+    message back at the front of its chat's queue; it is dropped (and handed to
+    on_error) only after OUTBOX_SEND_RETRIES retries.
+    """
+
+    def __init__(self, client, on_sent=None, on_error=None):
+        self.client = client
+        self.on_sent = on_sent
+        self.on_error = on_error
+        self._cond = threading.Condition()
+        self._next_ticket = {}   # { thread_id: next ticket to hand out }
+        self._next_release = {}  # { thread_id: next ticket allowed to go out }
+        self._completed = {}     # { thread_id: { ticket: (text, label) } }
+        self._sources = {}       # { (thread_id, ticket): what the reply answers, e.g. a message ID }
+        self._ready = OrderedDict()  # { thread_id: deque([(text, label, sources, failures)]) } waiting for the sender
+        self._buckets = {}       # { thread_id: TokenBucket }
+        self._global_bucket = TokenBucket(OUTBOX_GLOBAL_RATE, OUTBOX_GLOBAL_BURST)
+        self._sending = False
+        self._failures = 0         # Failed sends in a row, for the back-off
+        self._paused_until = 0.0   # monotonic() time before which nothing is sent
+        self.sent = 0
+        self.coalesced = 0
+        self._sender = threading.Thread(target=self._run, daemon=True)
+        self._sender.start()
+
+    def reserve(self, thread_id, source=None):
+        """
+        Reserves the next reply slot in a chat. Returns the ticket. `source` (e.g. the
+        message ID being answered) is handed back to on_sent once the reply goes out.
+        """
+        thread_id = str(thread_id)
+        with self._cond:
+            ticket = self._next_ticket.get(thread_id, 0)
+            self._next_ticket[thread_id] = ticket + 1
+            self._next_release.setdefault(thread_id, ticket)
+            if source is not None:
+                self._sources[(thread_id, ticket)] = source
+            return ticket
+
+    def complete(self, thread_id, ticket, text, label="BOT RESPONSE"):
+        """Fills a reserved slot. An empty text just releases the slot."""
+        thread_id = str(thread_id)
+        with self._cond:
+            self._completed.setdefault(thread_id, {})[ticket] = (text, label)
+            self._release(thread_id)
+            self._cond.notify_all()
+
+    def send(self, thread_id, text, label="BOT RESPONSE"):
+        """Queues a message behind every reply already reserved in the chat."""
+        self.complete(thread_id, self.reserve(thread_id), text, label)
+
+    def _release(self, thread_id):
+        completed = self._completed[thread_id]
+        while self._next_release[thread_id] in completed:
+            ticket = self._next_release[thread_id]
+            text, label = completed.pop(ticket)
+            source = self._sources.pop((thread_id, ticket), None)
+            self._next_release[thread_id] += 1
+            if text:
+                sources = [source] if source is not None else []
+                self._ready.setdefault(thread_id, deque()).append((text, label, sources, 0))
+                self._cond.notify_all()
+
+    def pending(self):
+        """Number of messages waiting for the sender."""
+        with self._cond:
+            return sum(len(queue) for queue in self._ready.values())
+
+    def unreleased(self):
+        """Number of reserved replies that haven't been released yet (commands still running, or queued behind one)."""
+        with self._cond:
+            return sum(self._next_ticket[t] - self._next_release[t] for t in self._next_ticket)
+
+    def drain(self, timeout, reserved=False):
+        """
+        Waits until everything released so far has been sent, and with `reserved`
+        also every reply reserved so far. Returns True if drained.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._ready or self._sending or (reserved and any(
+                    self._next_release[t] < self._next_ticket[t] for t in self._next_ticket)):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def _next_message(self):
+        """
+        Waits (with the lock held) for a chat that has replies queued and a token to
+        spend, then pops its backlog merged into one message.
+        Returns (thread_id, text, label, sources, failures).
+        """
+        while True:
+            if not self._ready:
+                self._cond.wait()
+                continue
+            now = time.monotonic()
+            if now < self._paused_until:
+                self._cond.wait(self._paused_until - now)
+                continue
+            global_wait = self._global_bucket.wait_time(now)
+            if global_wait > 0:
+                self._cond.wait(global_wait)
+                continue
+
+            shortest_wait = None
+            for thread_id in list(self._ready):
+                bucket = self._buckets.setdefault(thread_id, TokenBucket(OUTBOX_RATE, OUTBOX_BURST))
+                wait = bucket.wait_time(now)
+                if wait == 0:
+                    bucket.take(now)
+                    self._global_bucket.take(now)
+                    # Move the chat to the back so the next send serves another chat first
+                    queue = self._ready.pop(thread_id)
+                    text, label, sources, failures = self._coalesce(queue)
+                    if queue:
+                        self._ready[thread_id] = queue
+                    return thread_id, text, label, sources, failures
+                shortest_wait = wait if shortest_wait is None else min(shortest_wait, wait)
+            self._cond.wait(shortest_wait)
+
+    def _coalesce(self, queue):
+        """Pops the first queued reply plus as many following ones as fit in one message."""
+        text, label, sources, failures = queue.popleft()
+        sources = list(sources)
+        while queue and len(text) + 2 + len(queue[0][0]) <= OUTBOX_MAX_MESSAGE_CHARS:
+            next_text, _, next_sources, _ = queue.popleft()
+            text += "\n\n" + next_text
+            sources.extend(next_sources)
+            self.coalesced += 1
+        return text, label, sources, failures
+
+    def _send_failed(self, thread_id, text, label, sources, failures):
+        """
+        Pauses sending for the next back-off step and requeues the message first in
+        its chat (and its chat first in line). Returns the pause in seconds, or None
+        if the message has used up its retries and was dropped. Call with the lock held.
+        """
+        self._failures += 1
+        pause = min(OUTBOX_BACKOFF * 2 ** (self._failures - 1), OUTBOX_BACKOFF_MAX)
+        self._paused_until = time.monotonic() + pause
+        if failures >= OUTBOX_SEND_RETRIES:
+            return None
+        self._ready.setdefault(thread_id, deque()).appendleft((text, label, sources, failures + 1))
+        self._ready.move_to_end(thread_id, last=False)
+        return pause
+
+    def _run(self):
+        while True:
+            with self._cond:
+                thread_id, text, label, sources, failures = self._next_message()
+                self._sending = True
+            try:
+                self.client.direct_send(text, thread_ids=[thread_id])
+            except Exception as e:
+                with self._cond:
+                    retry_in = self._send_failed(thread_id, text, label, sources, failures)
+                if self.on_error:
+                    self.on_error(thread_id, text, e, retry_in)
+            else:
+                with self._cond:
+                    self._failures = 0
+                self.sent += 1
+                if self.on_sent:
+                    try:
+                        self.on_sent(thread_id, text, label, sources)
+                    except Exception as e:
+                        print(f"Error handling a sent message to {thread_id}: {e}")
+            finally:
+                with self._cond:
+                    self._sending = False
+                    self._cond.notify_all()
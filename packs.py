@@ -0,0 +1,236 @@
+# Compiled content packs: a list of prompts (or trivia questions) stored as
+#
+#   header | metadata (JSON) | offset table (count + 1 little-endian u64) | items (UTF-8)
+#   | keyword index: token count, token and posting offset tables, tokens, postings (u32)
+#
+# so item i is read straight out of a memory map without loading the rest of
+# the file, and the item count comes from the header. Keyword lookups binary
+# search the sorted tokens in the map and read only the matching postings. Build packs from the
+# files in 'lists' with:
+#
+#   python packs.py
+#
+# data_manager serves a pack instead of its source file while the pack is up
+# to date; rebuild after editing a list (a stale pack is ignored, not served).
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+import keywords
+
+# --- Format ---
+MAGIC = b"GCPK"
+VERSION = 2
+HEADER = struct.Struct("<4sHBxQQQ")  # magic, version, kind, padding, item count, metadata length, keyword index position
+OFFSET_PAIR = struct.Struct("<QQ")  # start and end of one item (or token, or posting list), relative to its data
+KIND_TEXT = 0
+KIND_JSON = 1
+
+PACK_EXTENSION = ".pack"
+SOURCE_EXTENSIONS = (".txt", ".json")
+
+class PackError(Exception):
+    """Raised for a file that isn't a valid content pack."""
+
+def pack_filename(source_filename):
+    """'truth.txt' -> 'truth.pack'."""
+    return os.path.splitext(source_filename)[0] + PACK_EXTENSION
+
+def source_filename(pack_path):
+    """'packs/truth.pack' -> 'truth.txt', from the kind in the pack's header (nothing else is read)."""
+    with open(pack_path, 'rb') as f:
+        header = f.read(HEADER.size)
+    if len(header) < HEADER.size:
+        raise PackError(f"{pack_path} is truncated")
+    magic, version, kind = HEADER.unpack(header)[:3]
+    if magic != MAGIC or version != VERSION:
+        raise PackError(f"{pack_path} is not a version {VERSION} content pack")
+    extension = ".json" if kind == KIND_JSON else ".txt"
+    return os.path.splitext(os.path.basename(pack_path))[0] + extension
+
+# --- Reader ---
+
+class ContentPack:
+    """
+    A read-only, memory-mapped pack that behaves like a list: len() comes from
+    the header and pack[i] decodes only item i. `metadata` holds the source
+    file's name and signature, and any precomputed groups (e.g. trivia
+    questions by difficulty).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            try:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise PackError(f"{path} is empty")
+        if len(self._map) < HEADER.size:
+            raise PackError(f"{path} is truncated")
+        magic, version, kind, count, metadata_length, keywords_at = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise PackError(f"{path} is not a version {VERSION} content pack")
+        self.kind = kind
+        self.count = count
+        self.metadata = json.loads(self._map[HEADER.size:HEADER.size + metadata_length].decode("utf-8"))
+        self._offsets_at = HEADER.size + metadata_length
+        self._data_at = self._offsets_at + (count + 1) * 8
+        if len(self._map) < self._data_at:
+            raise PackError(f"{path} is truncated")
+        self.postings = PackPostings(self._map, keywords_at) if keywords_at else None
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("content pack index out of range")
+        start, end = OFFSET_PAIR.unpack_from(self._map, self._offsets_at + index * 8)
+        text = self._map[self._data_at + start:self._data_at + end].decode("utf-8")
+        return json.loads(text) if self.kind == KIND_JSON else text
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield self[index]
+
+    @property
+    def groups(self):
+        """Precomputed { field: { value: [positions] } } groupings stored at build time (e.g. difficulty)."""
+        return self.metadata.get("groups", {})
+
+    def close(self):
+        self._map.close()
+
+class PackPostings:
+    """
+    The keyword index of a pack, read from its map on demand: get(token)
+    returns the token's item positions (an array of ints), or None.
+    """
+
+    def __init__(self, map, at):
+        self._map = map
+        (self.count,) = struct.unpack_from("<Q", map, at)
+        self._token_offsets_at = at + 8
+        self._posting_offsets_at = self._token_offsets_at + (self.count + 1) * 8
+        self._tokens_at = self._posting_offsets_at + (self.count + 1) * 8
+        tokens_length = struct.unpack_from("<Q", map, self._token_offsets_at + self.count * 8)[0]
+        self._postings_at = self._tokens_at + tokens_length
+
+    def _token(self, index):
+        start, end = OFFSET_PAIR.unpack_from(self._map, self._token_offsets_at + index * 8)
+        return self._map[self._tokens_at + start:self._tokens_at + end].decode("utf-8")
+
+    def get(self, token, default=None):
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._token(middle) < token:
+                low = middle + 1
+            else:
+                high = middle
+        if low == self.count or self._token(low) != token:
+            return default
+        start, end = OFFSET_PAIR.unpack_from(self._map, self._posting_offsets_at + low * 8)
+        positions = array("I")
+        positions.frombytes(self._map[self._postings_at + start:self._postings_at + end])
+        if sys.byteorder == "big":
+            positions.byteswap()
+        return positions
+
+# --- Builder ---
+
+def _read_source(source_path):
+    """Returns (kind, items) using the same parsing rules as data_manager."""
+    if source_path.endswith(".json"):
+        with open(source_path, 'r', encoding='utf-8') as f:
+            items = json.load(f)
+        if not isinstance(items, list):
+            raise PackError(f"{source_path} does not contain a JSON list")
+        return KIND_JSON, items
+    with open(source_path, 'r', encoding='utf-8') as f:
+        return KIND_TEXT, [line.strip() for line in f if line.strip()]
+
+def _write_postings(f, postings):
+    """Writes a { token: [positions] } index as the pack's keyword section, tokens sorted for binary search."""
+    tokens = sorted(postings)
+    token_bytes = [token.encode("utf-8") for token in tokens]
+    token_offsets = [0]
+    posting_offsets = [0]
+    for data, token in zip(token_bytes, tokens):
+        token_offsets.append(token_offsets[-1] + len(data))
+        posting_offsets.append(posting_offsets[-1] + 4 * len(postings[token]))
+    f.write(struct.pack("<Q", len(tokens)))
+    f.write(struct.pack(f"<{len(token_offsets)}Q", *token_offsets))
+    f.write(struct.pack(f"<{len(posting_offsets)}Q", *posting_offsets))
+    for data in token_bytes:
+        f.write(data)
+    for token in tokens:
+        positions = array("I", postings[token])
+        if sys.byteorder == "big":
+            positions.byteswap()
+        f.write(positions.tobytes())
+
+def build_pack(source_path, pack_path):
+    """Compiles a .txt or .json list into a pack. Returns the number of items."""
+    st = os.stat(source_path)
+    kind, items = _read_source(source_path)
+
+    metadata = {"source": os.path.basename(source_path), "source_sig": [st.st_mtime_ns, st.st_size]}
+    if kind == KIND_JSON:
+        difficulties = {}
+        for position, item in enumerate(items):
+            if isinstance(item, dict) and "difficulty" in item:
+                difficulties.setdefault(str(item["difficulty"]).lower(), []).append(position)
+        if difficulties:
+            metadata["groups"] = {"difficulty": difficulties}
+
+    encoded = [
+        (json.dumps(item, ensure_ascii=False, separators=(",", ":")) if kind == KIND_JSON else item).encode("utf-8")
+        for item in items
+    ]
+    offsets = [0]
+    for data in encoded:
+        offsets.append(offsets[-1] + len(data))
+    metadata_bytes = json.dumps(metadata, separators=(",", ":")).encode("utf-8")
+    keywords_at = HEADER.size + len(metadata_bytes) + len(offsets) * 8 + offsets[-1]
+
+    tmp_path = pack_path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, kind, len(encoded), len(metadata_bytes), keywords_at))
+        f.write(metadata_bytes)
+        f.write(struct.pack(f"<{len(offsets)}Q", *offsets))
+        for data in encoded:
+            f.write(data)
+        _write_postings(f, keywords.KeywordIndex.build(items).postings)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, pack_path)
+    return len(encoded)
+
+def build_all(lists_dir, packs_dir):
+    """Builds a pack for every list file in `lists_dir`. Returns { pack filename: item count }."""
+    os.makedirs(packs_dir, exist_ok=True)
+    built = {}
+    for filename in sorted(os.listdir(lists_dir)):
+        if not filename.endswith(SOURCE_EXTENSIONS):
+            continue
+        pack_name = pack_filename(filename)
+        built[pack_name] = build_pack(os.path.join(lists_dir, filename), os.path.join(packs_dir, pack_name))
+    return built
+
+def main(argv=None):
+    import data_manager as dm
+    parser = argparse.ArgumentParser(description="Compile the content lists into memory-mapped packs.")
+    parser.add_argument("--lists", default=dm.LISTS_DIR, help="Directory with the .txt and .json lists.")
+    parser.add_argument("--out", default=dm.PACKS_DIR, help="Directory to write the .pack files to.")
+    args = parser.parse_args(argv)
+    for pack_name, count in build_all(args.lists, args.out).items():
+        print(f"Built {os.path.join(args.out, pack_name)} ({count} items)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+# Example plugin. Files in this directory are loaded at startup unless their
+# name starts with '_'; copy this file to e.g. 'coinflip.py' to enable it.
+import random
+from commands import command
+
+@command("!coinflip", needs_username=False, cooldown=5, help="Flip a coin.")
+def cmd_coinflip(ctx):
+    return f"🪙 {random.choice(['Heads', 'Tails'])}!"
@@ -0,0 +1,297 @@
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+import data_manager as dm
+
+# --- File Paths ---
+CURSORS_FILE = os.path.join(dm.STATE_DIR, "cursors.json")
+
+# --- Polling Settings ---
+# Shortest and longest pause between two polls of the same chat (seconds).
+POLL_MIN_INTERVAL = float(os.getenv("POLL_MIN_INTERVAL", "1"))
+POLL_MAX_INTERVAL = float(os.getenv("POLL_MAX_INTERVAL", "15"))
+# Each idle poll stretches the interval by this factor.
+POLL_IDLE_FACTOR = float(os.getenv("POLL_IDLE_FACTOR", "1.5"))
+# Messages fetched per poll, and the most we page back to when catching up.
+POLL_PAGE_SIZE = int(os.getenv("POLL_PAGE_SIZE", "5"))
+POLL_MAX_CATCHUP = int(os.getenv("POLL_MAX_CATCHUP", "100"))
+# After an error backoff or a restart, the first poll pages back this far instead,
+# since every command sent during the outage is still waiting.
+POLL_OUTAGE_CATCHUP = int(os.getenv("POLL_OUTAGE_CATCHUP", "500"))
+# Messages that already exist when the bot starts listening for the first time are
+# skipped, not answered. After a restart the bot resumes from its saved cursor instead.
+POLL_SEED_SIZE = 20
+# Messages older than this (seconds) are never answered, e.g. after a long downtime.
+POLL_MAX_MESSAGE_AGE = float(os.getenv("POLL_MAX_MESSAGE_AGE", "3600"))
+# How many recent message IDs are remembered for de-duplication, per chat.
+SEEN_WINDOW_SIZE = int(os.getenv("SEEN_WINDOW_SIZE", "500"))
+# Backoff after an error: starts at ERROR_BACKOFF and doubles up to MAX_ERROR_BACKOFF.
+ERROR_BACKOFF = 60
+MAX_ERROR_BACKOFF = 600
+
+# --- Seen Messages ---
+
+class SeenWindow:
+    """The last `size` message IDs seen in a chat: a ring buffer plus a set for O(1) lookups."""
+
+    def __init__(self, size=SEEN_WINDOW_SIZE):
+        self._order = deque()
+        self._ids = set()
+        self.size = size
+
+    def __contains__(self, message_id):
+        return message_id in self._ids
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add(self, message_id):
+        if message_id in self._ids:
+            return
+        self._order.append(message_id)
+        self._ids.add(message_id)
+        if len(self._order) > self.size:
+            self._ids.discard(self._order.popleft())
+
+    def update(self, message_ids):
+        for message_id in message_ids:
+            self.add(message_id)
+
+# --- Cursors ---
+# The newest message handled in each chat, checkpointed to cursors.json so a
+# restart resumes where the bot left off instead of skipping recent messages.
+
+_cursors = None
+_cursors_dirty = False
+_cursors_lock = threading.Lock()
+
+def _load_cursors():
+    global _cursors
+    if _cursors is None:
+        _cursors = dm.load_json(CURSORS_FILE, {})
+    return _cursors
+
+def restore_cursor(thread_id, schedule):
+    """Restores a chat's saved cursor into its schedule. Returns True if one existed."""
+    with _cursors_lock:
+        cursor = _load_cursors().get(str(thread_id))
+    if not cursor:
+        return False
+    schedule.last_message_id = cursor.get("id")
+    schedule.last_message_ts = cursor.get("ts")
+    schedule.seeded = True
+    schedule.catching_up = True  # Commands may have been sent while the bot was down
+    return True
+
+def _record_cursor(thread_id, schedule):
+    global _cursors_dirty
+    with _cursors_lock:
+        _load_cursors()[str(thread_id)] = {"id": schedule.last_message_id, "ts": schedule.last_message_ts}
+        _cursors_dirty = True
+
+def save_cursors():
+    """Writes the cursors to disk if any changed since the last save."""
+    global _cursors_dirty
+    with _cursors_lock:
+        if not _cursors_dirty:
+            return
+        data = dict(_load_cursors())
+        _cursors_dirty = False
+    dm.save_json(CURSORS_FILE, data)
+
+dm.register_flush_hook(save_cursors)
+
+# --- Chat State ---
+
+class ChatState:
+    """
+    Polling state of one group chat. Only the listener thread writes it; other
+    threads read it through PollSchedule.stats().
+    """
+
+    def __init__(self, thread_id):
+        self.thread_id = thread_id
+        self.seen_messages = SeenWindow()
+        self.poll = PollSchedule()
+        restore_cursor(thread_id, self.poll)
+
+class ChatStates:
+    """Every chat's ChatState, created on first use. Safe to use from any thread."""
+
+    def __init__(self):
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def get(self, thread_id):
+        thread_id = str(thread_id)
+        state = self._states.get(thread_id)
+        if state is None:
+            with self._lock:
+                state = self._states.get(thread_id)
+                if state is None:
+                    state = self._states[thread_id] = ChatState(thread_id)
+        return state
+
+    def items(self):
+        """A snapshot of (thread_id, ChatState) pairs."""
+        with self._lock:
+            return list(self._states.items())
+
+    def stats(self):
+        """{ thread_id: PollSchedule.stats() } for every chat."""
+        return {thread_id: state.poll.stats() for thread_id, state in self.items()}
+
+# --- Poll Schedule ---
+
+class PollSchedule:
+    """Adaptive polling interval and counters for one group chat."""
+
+    def __init__(self):
+        self.interval = POLL_MIN_INTERVAL
+        self.next_poll = 0.0
+        self.backoff_delay = ERROR_BACKOFF
+        self.seeded = False
+        self.catching_up = False  # The next poll recovers from an outage
+        self.last_message_id = None
+        self.last_message_ts = None
+        self.polls = 0
+        self.idle_polls = 0
+        self.catchup_fetches = 0
+        self.catchup_passes = 0
+        self.errors = 0
+        self.messages = 0
+        self.commands = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    def is_due(self, now=None):
+        return (now or time.time()) >= self.next_poll
+
+    def record_poll(self, new_messages, new_commands):
+        """Tightens the interval while commands flow and backs off while the chat is idle."""
+        self.polls += 1
+        self.messages += new_messages
+        self.commands += new_commands
+        self.backoff_delay = ERROR_BACKOFF
+        if new_commands:
+            self.interval = POLL_MIN_INTERVAL
+        elif new_messages:
+            self.interval = max(POLL_MIN_INTERVAL, self.interval / 2)
+        else:
+            self.idle_polls += 1
+            self.interval = min(POLL_MAX_INTERVAL, self.interval * POLL_IDLE_FACTOR)
+        self.next_poll = time.time() + self.interval
+
+    def record_error(self):
+        """Schedules the next poll after the error backoff. Returns the delay used."""
+        delay = self.backoff_delay
+        self.errors += 1
+        self.next_poll = time.time() + delay
+        self.backoff_delay = min(delay * 2, MAX_ERROR_BACKOFF)
+        self.interval = POLL_MIN_INTERVAL
+        self.catching_up = True
+        return delay
+
+    def record_lag(self, message):
+        """Measures how long ago a message was sent, in seconds. Returns the lag or None."""
+        lag = message_age(message)
+        if lag is not None:
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+        return lag
+
+    def stats(self):
+        return {
+            "polls": self.polls,
+            "idle_polls": self.idle_polls,
+            "catchup_fetches": self.catchup_fetches,
+            "catchup_passes": self.catchup_passes,
+            "errors": self.errors,
+            "messages": self.messages,
+            "commands": self.commands,
+            "interval": round(self.interval, 2),
+            "last_lag": round(self.last_lag, 2),
+            "max_lag": round(self.max_lag, 2),
+        }
+
+# --- Fetching ---
+
+def message_age(message):
+    """Seconds since a message was sent, or None if it has no usable timestamp."""
+    sent_at = getattr(message, "timestamp", None)
+    if not isinstance(sent_at, datetime):
+        return None
+    now = datetime.now(timezone.utc) if sent_at.tzinfo else datetime.now()
+    return max(0.0, (now - sent_at).total_seconds())
+
+def message_epoch(message):
+    """A message's send time as a Unix timestamp, or None."""
+    sent_at = getattr(message, "timestamp", None)
+    return sent_at.timestamp() if isinstance(sent_at, datetime) else None
+
+def _advance_cursor(thread_id, schedule, newest_message):
+    schedule.last_message_id = newest_message.id
+    schedule.last_message_ts = message_epoch(newest_message)
+    _record_cursor(thread_id, schedule)
+
+def seed_thread(client, thread_id, schedule, seen_messages):
+    """Marks the chat's existing messages as seen. Returns how many were skipped."""
+    thread = client.direct_thread(thread_id=str(thread_id), amount=POLL_SEED_SIZE)
+    messages = thread.messages if thread and thread.messages else []
+    seen_messages.update(message.id for message in messages)
+    if messages:
+        _advance_cursor(thread_id, schedule, messages[0])
+    schedule.seeded = True
+    return len(messages)
+
+def fetch_new_messages(client, thread_id, schedule, seen_messages):
+    """
+    Fetches one chat and returns (thread, new_messages) with new messages oldest first.
+    If a whole page is unseen, the page is doubled until it reaches the last message
+    seen before (or POLL_MAX_CATCHUP), so bursts between polls are not dropped.
+    While the schedule is catching up after an outage, paging goes on up to
+    POLL_OUTAGE_CATCHUP; the flag is cleared once that fetch succeeds.
+    """
+    if not schedule.seeded:
+        seed_thread(client, thread_id, schedule, seen_messages)
+        return None, []
+
+    max_amount = POLL_OUTAGE_CATCHUP if schedule.catching_up else POLL_MAX_CATCHUP
+    amount = POLL_PAGE_SIZE
+    while True:
+        thread = client.direct_thread(thread_id=str(thread_id), amount=amount)
+        messages = thread.messages if thread and thread.messages else []
+        reached_cursor = (
+            schedule.last_message_id is not None
+            and any(message.id == schedule.last_message_id for message in messages)
+        )
+        if reached_cursor or len(messages) < amount or amount >= max_amount:
+            break
+        amount = min(amount * 2, max_amount)
+        schedule.catchup_fetches += 1
+
+    # Only messages after the cursor are new. If the cursor message wasn't reached
+    # (it was deleted, or the gap is larger than max_amount), fall back to its timestamp.
+    cursor_index = next((i for i, message in enumerate(messages) if message.id == schedule.last_message_id), None)
+    candidates = messages[:cursor_index] if cursor_index is not None else messages
+    new_messages = []
+    for message in reversed(candidates):
+        if message.id in seen_messages:
+            continue
+        sent_at = message_epoch(message)
+        if cursor_index is None and schedule.last_message_ts and sent_at is not None and sent_at <= schedule.last_message_ts:
+            continue
+        age = message_age(message)
+        if age is not None and age > POLL_MAX_MESSAGE_AGE:
+            seen_messages.add(message.id)
+            continue
+        new_messages.append(message)
+
+    if messages and messages[0].id != schedule.last_message_id:
+        _advance_cursor(thread_id, schedule, messages[0])
+    if schedule.catching_up:
+        schedule.catching_up = False
+        schedule.catchup_passes += 1
+    return thread, new_messages
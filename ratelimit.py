@@ -0,0 +1,104 @@
+import os
+import threading
+import time
+from collections import deque
+import data_manager as dm
+
+# --- Settings ---
+BLOCKS_FILE = os.path.join(dm.STATE_DIR, "blocked_users.json")
+# A user sending more than RATE_LIMIT_COMMANDS commands within RATE_LIMIT_WINDOW
+# seconds is blocked for RATE_LIMIT_BLOCK_SECONDS.
+RATE_LIMIT_COMMANDS = int(os.getenv("RATE_LIMIT_COMMANDS", "7"))
+RATE_LIMIT_WINDOW = float(os.getenv("RATE_LIMIT_WINDOW", "60"))
+RATE_LIMIT_BLOCK_SECONDS = float(os.getenv("RATE_LIMIT_BLOCK_SECONDS", str(3 * 3600)))
+# How often idle users and expired blocks are swept from memory (seconds).
+RATE_LIMIT_SWEEP_INTERVAL = float(os.getenv("RATE_LIMIT_SWEEP_INTERVAL", "300"))
+
+# --- Sliding Window Limiter ---
+
+class SlidingWindowLimiter:
+    """
+    Per-key sliding-window rate limiter with temporary blocks.
+
+    Each key keeps at most `limit` timestamps in a bounded deque, so a check is
+    O(1): the command is over the limit exactly when the deque is full and its
+    oldest timestamp is still inside the window. Idle keys and expired blocks
+    are dropped by sweep(); blocks are persisted so they survive restarts.
+    """
+
+    def __init__(self, limit=RATE_LIMIT_COMMANDS, window=RATE_LIMIT_WINDOW,
+                 block_seconds=RATE_LIMIT_BLOCK_SECONDS, path=BLOCKS_FILE):
+        self.limit = limit
+        self.window = window
+        self.block_seconds = block_seconds
+        self.path = path
+        self._windows = {}  # { key: deque of command timestamps }
+        self._blocked = {}  # { key: block expiration timestamp }
+        self._lock = threading.Lock()
+        self._sweeper = None
+        if path:
+            now = time.time()
+            self._blocked = {key: expires for key, expires in dm.load_json(path, {}).items() if expires > now}
+
+    def check(self, key, now=None):
+        """
+        Records a command for `key`. Returns "ok", "unblocked" (an expired block was
+        lifted; the command is allowed), "blocked", or "just_blocked".
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            status = "ok"
+            expires = self._blocked.get(key)
+            if expires is not None:
+                if now < expires:
+                    return "blocked"
+                del self._blocked[key]
+                self._save_blocks()
+                status = "unblocked"
+
+            timestamps = self._windows.get(key)
+            if timestamps is None:
+                timestamps = self._windows[key] = deque(maxlen=self.limit)
+            if len(timestamps) == self.limit and now - timestamps[0] < self.window:
+                self._blocked[key] = now + self.block_seconds
+                # Forget their history so they don't get re-blocked right after
+                del self._windows[key]
+                self._save_blocks()
+                return "just_blocked"
+            timestamps.append(now)
+            return status
+
+    def sweep(self, now=None):
+        """Drops users idle for a whole window and blocks that have expired."""
+        now = time.time() if now is None else now
+        with self._lock:
+            idle = [key for key, timestamps in self._windows.items() if not timestamps or now - timestamps[-1] >= self.window]
+            for key in idle:
+                del self._windows[key]
+            expired = [key for key, expires in self._blocked.items() if expires <= now]
+            for key in expired:
+                del self._blocked[key]
+            if expired:
+                self._save_blocks()
+        return len(idle) + len(expired)
+
+    def tracked(self):
+        """Number of keys currently held in memory (windows, blocks)."""
+        return len(self._windows), len(self._blocked)
+
+    def start_sweeper(self, interval=RATE_LIMIT_SWEEP_INTERVAL):
+        """Runs sweep() on a daemon thread every `interval` seconds."""
+        if self._sweeper is not None:
+            return
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                self.sweep()
+
+        self._sweeper = threading.Thread(target=loop, daemon=True)
+        self._sweeper.start()
+
+    def _save_blocks(self):
+        if self.path:
+            dm.save_json(self.path, dict(self._blocked))
@@ -0,0 +1,218 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from birthdays import month_day_key
+
+# --- Schema ---
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS scores (
+    user_id TEXT PRIMARY KEY,
+    points INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_scores_points ON scores (points DESC);
+CREATE TABLE IF NOT EXISTS period_scores (
+    period TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    points INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (period, user_id)
+);
+CREATE INDEX IF NOT EXISTS idx_period_scores_points ON period_scores (period, points DESC);
+CREATE TABLE IF NOT EXISTS birthdays (
+    user_id TEXT PRIMARY KEY,
+    bday TEXT NOT NULL,
+    month_day TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_birthdays_month_day ON birthdays (month_day);
+CREATE TABLE IF NOT EXISTS custom_commands (
+    name TEXT PRIMARY KEY,
+    response TEXT NOT NULL
+);
+"""
+
+# --- Store ---
+
+class SQLiteStore:
+    """Scores, birthdays and custom commands in one SQLite database (WAL mode)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._write_conn = None
+        self._write_lock = threading.Lock()
+        with self._writing() as conn:
+            conn.executescript(SCHEMA)
+            # Rows written before 29-02 was accepted have no month-day key yet
+            rows = conn.execute("SELECT user_id, bday FROM birthdays WHERE month_day IS NULL").fetchall()
+            conn.executemany(
+                "UPDATE birthdays SET month_day = ? WHERE user_id = ?",
+                [(month_day_key(bday), user_id) for user_id, bday in rows if month_day_key(bday)],
+            )
+
+    def _connect(self, **kwargs):
+        conn = sqlite3.connect(self.path, timeout=10, **kwargs)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _conn(self):
+        """Returns this thread's connection (used for reads), opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def _shared_conn(self):
+        """Returns the connection shared by every thread; the caller holds _write_lock."""
+        if self._write_conn is None:
+            self._write_conn = self._connect(check_same_thread=False)
+        return self._write_conn
+
+    @contextmanager
+    def _writing(self):
+        """
+        A transaction on the one connection every write of this process goes
+        through. Threads still read on their own connections.
+        """
+        with self._write_lock:
+            with self._shared_conn() as conn:
+                yield conn
+
+    def data_version(self):
+        """
+        Changes whenever another process commits. Read on the connection this
+        process writes through, so its own commits don't change it.
+        """
+        with self._write_lock:
+            return self._shared_conn().execute("PRAGMA data_version").fetchone()[0]
+
+    # --- Migration ---
+
+    def migrate_from_json(self, scores, birthdays, custom_commands):
+        """Imports the JSON data files once. Later calls are no-ops, also in other processes."""
+        with self._writing() as conn:
+            # Claiming the marker first takes the write lock, so of several workers
+            # starting at once only one imports; the others wait and find it claimed
+            claimed = conn.execute(
+                "INSERT OR IGNORE INTO meta (key, value) VALUES ('json_migrated', ?)", (datetime.now().isoformat(),)
+            ).rowcount
+            if not claimed:
+                return False
+            conn.executemany(
+                "INSERT OR REPLACE INTO scores (user_id, points) VALUES (?, ?)",
+                [(str(uid), int(points)) for uid, points in scores.items()],
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO birthdays (user_id, bday, month_day) VALUES (?, ?, ?)",
+                [(str(uid), bday, month_day_key(bday)) for uid, bday in birthdays.items()],
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO custom_commands (name, response) VALUES (?, ?)",
+                list(custom_commands.items()),
+            )
+        return True
+
+    # --- Scores ---
+
+    def load_scores(self):
+        rows = self._conn().execute("SELECT user_id, points FROM scores").fetchall()
+        return dict(rows)
+
+    def add_score(self, user_id, points=1, periods=()):
+        """
+        Adds points to the all-time score and to each period bucket in `periods`.
+        Returns the new totals as (all_time, [per period]).
+        """
+        user_id = str(user_id)
+        with self._writing() as conn:
+            conn.execute(
+                "INSERT INTO scores (user_id, points) VALUES (?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET points = points + excluded.points",
+                (user_id, points),
+            )
+            total = conn.execute("SELECT points FROM scores WHERE user_id = ?", (user_id,)).fetchone()[0]
+            period_totals = []
+            for period in periods:
+                conn.execute(
+                    "INSERT INTO period_scores (period, user_id, points) VALUES (?, ?, ?) "
+                    "ON CONFLICT(period, user_id) DO UPDATE SET points = points + excluded.points",
+                    (period, user_id, points),
+                )
+                period_totals.append(conn.execute(
+                    "SELECT points FROM period_scores WHERE period = ? AND user_id = ?", (period, user_id)
+                ).fetchone()[0])
+        return total, period_totals
+
+    def get_leaderboard(self, limit=None, period=None):
+        if period is None:
+            query, params = "SELECT user_id, points FROM scores ORDER BY points DESC", ()
+        else:
+            query, params = "SELECT user_id, points FROM period_scores WHERE period = ? ORDER BY points DESC", (period,)
+        if limit is None:
+            return self._conn().execute(query, params).fetchall()
+        return self._conn().execute(query + " LIMIT ?", params + (limit,)).fetchall()
+
+    def prune_periods(self, keep):
+        """Deletes the buckets of every period not in `keep`."""
+        keep = list(keep)
+        with self._writing() as conn:
+            conn.execute(
+                f"DELETE FROM period_scores WHERE period NOT IN ({','.join('?' * len(keep))})", keep
+            )
+
+    # --- Birthdays ---
+
+    def load_birthdays(self):
+        rows = self._conn().execute("SELECT user_id, bday FROM birthdays").fetchall()
+        return dict(rows)
+
+    def set_birthday(self, user_id, bday_str):
+        with self._writing() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO birthdays (user_id, bday, month_day) VALUES (?, ?, ?)",
+                (str(user_id), bday_str, month_day_key(bday_str)),
+            )
+
+    def get_all_birthdays(self):
+        rows = self._conn().execute(
+            "SELECT user_id, bday FROM birthdays ORDER BY month_day IS NULL, month_day"
+        ).fetchall()
+        return dict(rows)
+
+    def get_upcoming_birthdays(self, start_key, limit):
+        """Up to `limit` birthdays from month-day `start_key` on, wrapping around the end of the year."""
+        query = "SELECT user_id, bday FROM birthdays WHERE month_day {} ? ORDER BY month_day LIMIT ?"
+        conn = self._conn()
+        rows = conn.execute(query.format(">="), (start_key, limit)).fetchall()
+        if len(rows) < limit:
+            rows += conn.execute(query.format("<"), (start_key, limit - len(rows))).fetchall()
+        return rows
+
+    def get_birthdays_on(self, keys):
+        keys = list(keys)
+        return self._conn().execute(
+            f"SELECT user_id, bday FROM birthdays WHERE month_day IN ({','.join('?' * len(keys))})", keys
+        ).fetchall()
+
+    # --- Custom Commands ---
+
+    def load_custom_commands(self):
+        rows = self._conn().execute("SELECT name, response FROM custom_commands").fetchall()
+        return dict(rows)
+
+    def save_custom_commands(self, commands_data):
+        with self._writing() as conn:
+            conn.execute("DELETE FROM custom_commands")
+            conn.executemany(
+                "INSERT INTO custom_commands (name, response) VALUES (?, ?)",
+                list(commands_data.items()),
+            )
+
+    def set_custom_command(self, name, response):
+        with self._writing() as conn:
+            conn.execute("INSERT OR REPLACE INTO custom_commands (name, response) VALUES (?, ?)", (name, response))
+
@@ -0,0 +1,103 @@
+import os
+import threading
+import time
+import data_manager as dm
+import keywords
+import trivia
+
+# --- Settings ---
+# Trust a saved session.json instead of logging in and checking it at startup;
+# the session is only re-validated if an API call is rejected.
+FAST_START = os.getenv("FAST_START", "false").lower() in ("1", "true", "yes")
+
+# --- Phase Timing ---
+
+class StartupTimer:
+    """Records how long each startup phase took, measured from `started`."""
+
+    def __init__(self, started=None):
+        self.started = started if started is not None else time.perf_counter()
+        self.phases = []  # [(name, seconds)]
+        self._last = self.started
+
+    def mark(self, name):
+        """Ends the current phase, named `name`, and starts the next one."""
+        now = time.perf_counter()
+        self.phases.append((name, now - self._last))
+        self._last = now
+
+    def total(self):
+        return self._last - self.started
+
+    def report(self):
+        """One line, e.g. 'imports 0.41s, login 0.02s, ... (total 0.52s)'."""
+        parts = [f"{name} {seconds:.2f}s" for name, seconds in self.phases]
+        return f"{', '.join(parts)} (total {self.total():.2f}s)"
+
+# --- Lazy Session Validation ---
+
+SESSION_ENDPOINTS = ("direct_thread", "direct_messages", "direct_send", "user_info_v1", "user_info")
+
+def guard_session(client, relogin, login_errors, endpoints=SESSION_ENDPOINTS):
+    """
+    Wraps the client's API methods so a call rejected with one of `login_errors`
+    logs in again through `relogin()` and is retried once. Concurrent failures
+    share one re-login: a call only triggers it if nobody re-logged in since
+    the call started.
+    """
+    lock = threading.Lock()
+    generation = [0]  # Bumped after every successful re-login
+
+    def renew(seen_generation):
+        with lock:
+            if generation[0] == seen_generation:
+                relogin()
+                generation[0] += 1
+
+    for endpoint in endpoints:
+        method = getattr(client, endpoint, None)
+        if method is None:
+            continue
+
+        def wrapper(*args, _method=method, **kwargs):
+            seen_generation = generation[0]
+            try:
+                return _method(*args, **kwargs)
+            except login_errors:
+                renew(seen_generation)
+                return _method(*args, **kwargs)
+
+        setattr(client, endpoint, wrapper)
+    return client
+
+# --- Cache Warm-Up ---
+
+# Text lists searched by !truth <keyword> and !dare <keyword>: { index name used by the bot: file }
+KEYWORD_LISTS = {"truths": "truth.txt", "dares": "dares.txt"}
+
+def warm_up_caches():
+    """Loads content lists and their keyword indexes, scores, birthdays and custom commands so the first commands don't wait on disk."""
+    dm.get_list_file_details()
+    questions = dm.load_json_from_lists(trivia.TRIVIA_FILE)
+    trivia.difficulty_index(questions)
+    keywords.index_for(trivia.TRIVIA_FILE, questions)
+    for name, filename in KEYWORD_LISTS.items():
+        keywords.index_for(name, dm.load_list(filename))
+    dm.get_leaderboard(1)
+    dm.get_upcoming_birthdays(1)
+    dm.load_custom_commands()
+
+def start_warm_up(on_done=None):
+    """Runs warm_up_caches() on a daemon thread. `on_done(seconds)` is called when it finishes."""
+    def run():
+        started = time.perf_counter()
+        try:
+            warm_up_caches()
+        except Exception as e:
+            print(f"Error warming up caches: {e}")
+        if on_done:
+            on_done(time.perf_counter() - started)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,195 @@
+# Runs one bot worker process per Instagram account, so sends and polls are
+# spread over several accounts' rate limits instead of one:
+#
+#   IG_ACCOUNTS="first_account:password1,second_account:password2"
+#   IG_GROUP_CHAT_IDS="1234,5678,9012"
+#   python supervisor.py
+#
+# Group chats are assigned to accounts by consistent hashing, so adding an
+# account only moves the chats it takes over. Workers share scores, birthdays
+# and custom commands through the SQLite database; everything else they keep
+# in data/workers/<account>/. A worker that exits is restarted with backoff.
+import bisect
+import hashlib
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from dotenv import load_dotenv
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# --- Settings ---
+SESSIONS_DIR = "sessions"
+HASH_REPLICAS = 100          # Points per account on the hash ring
+WORKER_RESTART_DELAY = 5     # Seconds before restarting a worker that exited
+MAX_WORKER_RESTART_DELAY = 300
+WORKER_STOP_TIMEOUT = 30     # Seconds a worker gets to flush and exit on shutdown
+
+# --- Consistent Hashing ---
+
+def _hash(key):
+    return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+class HashRing:
+    """
+    Maps keys to nodes. Each node owns HASH_REPLICAS points on a ring, and a key
+    belongs to the first point at or after its hash, so adding or removing a
+    node only moves the keys on the arcs it gains or loses.
+    """
+
+    def __init__(self, nodes, replicas=HASH_REPLICAS):
+        self._points = sorted((_hash(f"{node}#{i}"), node) for node in nodes for i in range(replicas))
+        self._hashes = [point for point, _ in self._points]
+
+    def node_for(self, key):
+        if not self._points:
+            return None
+        i = bisect.bisect(self._hashes, _hash(str(key))) % len(self._points)
+        return self._points[i][1]
+
+def assign_threads(thread_ids, accounts):
+    """Returns { account: [thread_ids] } for every account that gets at least one chat."""
+    ring = HashRing(accounts)
+    assignment = {}
+    for thread_id in thread_ids:
+        assignment.setdefault(ring.node_for(thread_id), []).append(thread_id)
+    return assignment
+
+def parse_accounts(value):
+    """Parses 'user:password,user2:password2' into [(user, password)]."""
+    accounts = []
+    for entry in (value or "").split(","):
+        username, _, password = entry.strip().partition(":")
+        if username and password:
+            accounts.append((username, password))
+    return accounts
+
+# --- Supervisor ---
+
+class Worker:
+    def __init__(self, username, password, thread_ids, index):
+        self.username = username
+        self.password = password
+        self.thread_ids = thread_ids
+        self.index = index
+        self.process = None
+        self.restart_delay = WORKER_RESTART_DELAY
+        self.restart_at = 0
+        self.started_at = 0
+        self.stopped = False  # Shut down on purpose (exit code 0, e.g. !exit); not restarted
+
+class Supervisor:
+    """Starts, watches and stops the worker processes."""
+
+    def __init__(self, accounts, thread_ids):
+        passwords = dict(accounts)
+        self.workers = [
+            Worker(username, passwords[username], assigned, index)
+            for index, (username, assigned) in enumerate(sorted(assign_threads(thread_ids, list(passwords)).items()))
+        ]
+        self._stopping = threading.Event()
+
+    def worker_env(self, worker):
+        env = dict(os.environ)
+        env.update({
+            "IG_USERNAME": worker.username,
+            "IG_PASSWORD": worker.password,
+            "IG_GROUP_CHAT_IDS": ",".join(worker.thread_ids),
+            "IG_SESSION_FILE": os.path.join(SESSIONS_DIR, f"{worker.username}.json"),
+            "BOT_WORKER_ID": worker.username,
+            "STORAGE_BACKEND": "sqlite",
+            "PYTHONUNBUFFERED": "1",
+        })
+        env.pop("IG_GROUP_CHAT_ID", None)
+        env.pop("IG_ACCOUNTS", None)
+        if env.get("METRICS_PORT"):
+            # One port per worker, after the configured one
+            env["METRICS_PORT"] = str(int(env["METRICS_PORT"]) + worker.index)
+        return env
+
+    def start_worker(self, worker):
+        worker.process = subprocess.Popen(
+            [sys.executable, os.path.join(REPO_DIR, "bot.py")],
+            env=self.worker_env(worker),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            bufsize=1,
+        )
+        worker.started_at = time.monotonic()
+        threading.Thread(target=self._relay_output, args=(worker, worker.process), daemon=True).start()
+        print(f"Started worker {worker.username} (pid {worker.process.pid}) for chats {', '.join(worker.thread_ids)}")
+
+    def _relay_output(self, worker, process):
+        for line in process.stdout:
+            print(f"[{worker.username}] {line}", end="", flush=True)
+
+    def run(self):
+        """Runs the workers until interrupted or all have shut down, restarting any that fail."""
+        os.makedirs(SESSIONS_DIR, exist_ok=True)
+        for worker in self.workers:
+            self.start_worker(worker)
+        try:
+            while not self._stopping.wait(1):
+                now = time.monotonic()
+                for worker in self.workers:
+                    code = worker.process.poll() if worker.process else None
+                    if code == 0:
+                        print(f"Worker {worker.username} shut down; not restarting it")
+                        worker.process = None
+                        worker.stopped = True
+                    elif code is not None:
+                        if now - worker.started_at > MAX_WORKER_RESTART_DELAY:
+                            worker.restart_delay = WORKER_RESTART_DELAY  # It had been running fine
+                        print(f"Worker {worker.username} exited with code {code}; restarting in {worker.restart_delay}s")
+                        worker.process = None
+                        worker.restart_at = now + worker.restart_delay
+                        worker.restart_delay = min(worker.restart_delay * 2, MAX_WORKER_RESTART_DELAY)
+                    elif worker.process is None and not worker.stopped and now >= worker.restart_at:
+                        self.start_worker(worker)
+                if all(worker.stopped for worker in self.workers):
+                    print("Every worker has shut down.")
+                    break
+        except KeyboardInterrupt:
+            pass
+        self.stop()
+
+    def stop(self):
+        """Asks every worker to shut down (flushing its state), killing any that don't in time."""
+        self._stopping.set()
+        running = [worker.process for worker in self.workers if worker.process and worker.process.poll() is None]
+        for process in running:
+            process.send_signal(signal.SIGINT)
+        deadline = time.monotonic() + WORKER_STOP_TIMEOUT
+        for process in running:
+            try:
+                process.wait(max(0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+def main():
+    load_dotenv()
+    accounts = parse_accounts(os.getenv("IG_ACCOUNTS"))
+    group_chat_ids = os.getenv("IG_GROUP_CHAT_IDS") or os.getenv("IG_GROUP_CHAT_ID")
+    if not accounts or not group_chat_ids:
+        print("Error: Set IG_ACCOUNTS (user:password,...) and IG_GROUP_CHAT_IDS in the .env file.")
+        sys.exit(1)
+    try:
+        thread_ids = [str(int(tid)) for tid in group_chat_ids.split(",") if tid.strip()]
+    except ValueError:
+        print(f"Error: IG_GROUP_CHAT_IDS must be numeric thread IDs separated by commas, got '{group_chat_ids}'.")
+        sys.exit(1)
+
+    supervisor = Supervisor(accounts, thread_ids)
+    for worker in supervisor.workers:
+        print(f"{worker.username}: {len(worker.thread_ids)} chat(s)")
+    # SIGTERM (e.g. from a service manager) shuts down like CTRL+C
+    signal.signal(signal.SIGTERM, lambda signum, frame: supervisor._stopping.set())
+    supervisor.run()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+import math
+import os
+import threading
+import time
+import data_manager as dm
+import decks
+import keywords
+
+# --- Settings ---
+TRIVIA_FILE = "trivia.json"
+DIFFICULTIES = ("easy", "medium", "hard")
+# Seconds a question stays open before the answer is revealed.
+TRIVIA_TIMEOUT = float(os.getenv("TRIVIA_TIMEOUT", "60"))
+# Seconds per question in a timed round (!trivia round).
+TRIVIA_ROUND_SECONDS = float(os.getenv("TRIVIA_ROUND_SECONDS", "30"))
+TRIVIA_ROUND_DEFAULT = 5
+TRIVIA_ROUND_MAX = 20
+# If enabled, every user gets their own question instead of one per chat.
+TRIVIA_PER_USER = os.getenv("TRIVIA_PER_USER", "false").lower() in ("1", "true", "yes")
+
+# --- Timer Wheel ---
+
+class Timer:
+    def __init__(self, callback, rounds):
+        self.callback = callback
+        self.rounds = rounds  # Full turns of the wheel left before it fires
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+class TimerWheel:
+    """
+    A hashed timer wheel: `slots` buckets, one of which is emptied every `tick`
+    seconds. Scheduling and cancelling are O(1), and one thread serves every
+    timeout, however many questions are open. Timers further away than a full
+    turn wait out the extra turns in their bucket.
+    """
+
+    def __init__(self, tick=1.0, slots=64):
+        self.tick = tick
+        self._slots = [[] for _ in range(slots)]
+        self._current = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def schedule(self, delay, callback):
+        """Calls `callback()` after roughly `delay` seconds (rounded up to whole ticks). Returns a Timer."""
+        ticks = max(1, math.ceil(delay / self.tick))
+        timer = Timer(callback, (ticks - 1) // len(self._slots))
+        with self._lock:
+            self._slots[(self._current + ticks) % len(self._slots)].append(timer)
+        self.start()
+        return timer
+
+    def advance(self):
+        """Moves the wheel one tick forward and runs the timers that fell due."""
+        with self._lock:
+            self._current = (self._current + 1) % len(self._slots)
+            slot = self._slots[self._current]
+            due = [timer for timer in slot if timer.rounds == 0 and not timer.cancelled]
+            waiting = [timer for timer in slot if timer.rounds > 0 and not timer.cancelled]
+            for timer in waiting:
+                timer.rounds -= 1
+            self._slots[self._current] = waiting
+        for timer in due:
+            try:
+                timer.callback()
+            except Exception as e:
+                print(f"Error in timer callback: {e}")
+
+    def start(self):
+        """Starts the ticking thread, if it isn't running yet."""
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+
+            def loop():
+                next_tick = time.monotonic() + self.tick
+                while True:
+                    time.sleep(max(0, next_tick - time.monotonic()))
+                    next_tick += self.tick
+                    self.advance()
+
+            self._thread = threading.Thread(target=loop, daemon=True)
+            self._thread.start()
+
+# --- Questions ---
+# Questions are grouped by difficulty once per load of trivia.json; each
+# difficulty is then dealt from its own deck of positions in that group.
+
+_difficulty_index = (None, {})  # (questions list it was built from, { difficulty: [positions] })
+
+def difficulty_index(questions):
+    """Returns { difficulty: [positions in questions] }, rebuilt only when the list changes."""
+    global _difficulty_index
+    source, index = _difficulty_index
+    if source is not questions:
+        # Content packs store the grouping, so their questions needn't be decoded
+        index = getattr(questions, "groups", {}).get("difficulty")
+        if index is None:
+            index = {}
+            for position, question in enumerate(questions):
+                index.setdefault(str(question.get("difficulty", "")).lower(), []).append(position)
+        _difficulty_index = (questions, index)
+    return index
+
+def pick_question(thread_id, difficulty=None, topic=None):
+    """
+    Draws a question for a chat, from one difficulty and/or about a topic (words
+    of the question or its options) if given. Returns (question, reshuffled),
+    or (None, False) if there is no such question.
+    """
+    questions = dm.load_json_from_lists(TRIVIA_FILE)
+    if not questions:
+        return None, False
+    if difficulty is None and not topic:
+        index, reshuffled = decks.draw(f"{thread_id}:trivia", len(questions))
+        return questions[index], reshuffled
+    deck = f"{thread_id}:trivia"
+    positions = None
+    if difficulty is not None:
+        positions = difficulty_index(questions).get(difficulty) or []
+        deck += f":{difficulty}"
+    if topic:
+        matches = keywords.lookup(TRIVIA_FILE, questions, topic)
+        positions = matches if positions is None else sorted(set(positions).intersection(matches))
+        deck += ":about:" + " ".join(sorted(keywords.tokenize(topic)))
+    if not positions:
+        return None, False
+    index, reshuffled = decks.draw(deck, len(positions), filtered=bool(topic))
+    return questions[positions[index]], reshuffled
+
+# --- Sessions ---
+
+class TriviaRound:
+    """A timed series of questions in one chat; each goes to the first correct answer."""
+
+    def __init__(self, thread_id, total, difficulty=None, seconds=TRIVIA_ROUND_SECONDS, topic=None):
+        self.thread_id = thread_id
+        self.total = total
+        self.difficulty = difficulty
+        self.topic = topic
+        self.seconds = seconds
+        self.number = 0   # Questions asked so far
+        self.scores = {}  # { user_id: questions won }
+
+    @property
+    def finished(self):
+        return self.number >= self.total
+
+    def standings(self):
+        return sorted(self.scores.items(), key=lambda item: item[1], reverse=True)
+
+class TriviaSession:
+    """One open question."""
+
+    def __init__(self, thread_id, user_id, question, reshuffled, timeout, round=None):
+        self.thread_id = thread_id
+        self.user_id = user_id  # Who asked for it
+        self.question = question
+        self.answer = question["answer"].lower()
+        self.reshuffled = reshuffled
+        self.timeout = timeout
+        self.round = round
+        self.winner = None
+        self.next = None  # The round's next question, once this one is over
+        self.timer = None
+
+class TriviaEngine:
+    """
+    Open trivia questions for every chat, keyed by chat (or by chat and user
+    when per_user is set; rounds are always shared by the whole chat).
+    Unanswered questions expire on the timer wheel, which reveals the answer
+    through `on_expire(session)` and moves a round on to its next question.
+    """
+
+    def __init__(self, on_expire, wheel=None, timeout=TRIVIA_TIMEOUT, per_user=TRIVIA_PER_USER,
+                 pick=pick_question):
+        self.on_expire = on_expire
+        self.wheel = wheel or TimerWheel()
+        self.timeout = timeout
+        self.per_user = per_user
+        self.pick = pick
+        self._sessions = {}  # { (thread_id, user_id or None): TriviaSession }
+        self._lock = threading.RLock()
+
+    def _key(self, thread_id, user_id):
+        return (str(thread_id), str(user_id) if self.per_user else None)
+
+    def _find(self, thread_id, user_id):
+        """The question a user's answer is meant for: their own, else the chat's."""
+        for key in (self._key(thread_id, user_id), (str(thread_id), None)):
+            session = self._sessions.get(key)
+            if session:
+                return key, session
+        return None, None
+
+    def _open(self, key, session):
+        old = self._sessions.get(key)
+        if old and old.timer:
+            old.timer.cancel()
+        self._sessions[key] = session
+        session.timer = self.wheel.schedule(session.timeout, lambda: self._expire(key, session))
+        return session
+
+    def _close(self, key, session):
+        """Ends a question and, in a round, opens the next one."""
+        del self._sessions[key]
+        if session.timer:
+            session.timer.cancel()
+        round = session.round
+        if round and not round.finished:
+            question, reshuffled = self.pick(round.thread_id, round.difficulty, round.topic)
+            if question is None:
+                round.total = round.number
+                return
+            round.number += 1
+            session.next = self._open(key, TriviaSession(round.thread_id, None, question, reshuffled,
+                                                         round.seconds, round))
+
+    def _expire(self, key, session):
+        with self._lock:
+            if self._sessions.get(key) is not session:
+                return
+            self._close(key, session)
+        self.on_expire(session)
+
+    def ask(self, thread_id, user_id, difficulty=None, topic=None):
+        """Opens a new question, replacing any open one. Returns the session, or None if there are no such questions."""
+        thread_id = str(thread_id)
+        with self._lock:
+            current = self._sessions.get((thread_id, None))
+            if current and current.round:
+                return current  # A round is running; its question stays
+            question, reshuffled = self.pick(thread_id, difficulty, topic)
+            if question is None:
+                return None
+            key = self._key(thread_id, user_id)
+            return self._open(key, TriviaSession(thread_id, str(user_id), question, reshuffled, self.timeout))
+
+    def start_round(self, thread_id, user_id, total, difficulty=None, topic=None):
+        """
+        Starts a timed round in a chat. Returns (session, started): the first
+        question of the new round, or the open question of a round already running.
+        """
+        thread_id = str(thread_id)
+        with self._lock:
+            current = self._sessions.get((thread_id, None))
+            if current and current.round:
+                return current, False
+            question, reshuffled = self.pick(thread_id, difficulty, topic)
+            if question is None:
+                return None, False
+            round = TriviaRound(thread_id, total, difficulty, topic=topic)
+            round.number = 1
+            session = TriviaSession(thread_id, str(user_id), question, reshuffled, round.seconds, round)
+            return self._open((thread_id, None), session), True
+
+    def answer(self, thread_id, user_id, answer):
+        """Checks an answer. Returns ("none" | "wrong" | "correct", session)."""
+        with self._lock:
+            key, session = self._find(thread_id, user_id)
+            if session is None:
+                return "none", None
+            if answer.lower() != session.answer:
+                return "wrong", session
+            session.winner = str(user_id)
+            if session.round:
+                session.round.scores[session.winner] = session.round.scores.get(session.winner, 0) + 1
+            self._close(key, session)
+        return "correct", session
+
+    def has_open(self, thread_id, user_id):
+        """True if a user's answer in this chat would go to an open question."""
+        with self._lock:
+            return self._find(thread_id, user_id)[1] is not None
+
+    def skip(self, thread_id, user_id):
+        """Ends the open question without a winner. Returns its session, or None."""
+        with self._lock:
+            key, session = self._find(thread_id, user_id)
+            if session is None:
+                return None
+            self._close(key, session)
+        return session
+
+    def active(self):
+        """Number of open questions."""
+        return len(self._sessions)
@@ -0,0 +1,104 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import data_manager as dm
+
+# --- Settings ---
+USERNAMES_FILE = os.path.join(dm.STATE_DIR, "usernames.json")
+# Most usernames kept; the least recently used are evicted beyond this.
+USERNAME_CACHE_SIZE = int(os.getenv("USERNAME_CACHE_SIZE", "5000"))
+# How long a resolved username is trusted (seconds), default one week.
+USERNAME_TTL = float(os.getenv("USERNAME_TTL", str(7 * 24 * 3600)))
+# How long a failed lookup is remembered before it is retried (seconds).
+USERNAME_NEGATIVE_TTL = float(os.getenv("USERNAME_NEGATIVE_TTL", "600"))
+# Parallel lookups used by prefetch.
+USERNAME_PREFETCH_WORKERS = int(os.getenv("USERNAME_PREFETCH_WORKERS", "8"))
+
+# --- Username Cache ---
+
+class UsernameCache:
+    """
+    An LRU + TTL cache of user ID -> username, persisted to usernames.json.
+    Failed lookups are cached as None for a shorter time so they aren't retried
+    on every message.
+    """
+
+    def __init__(self, path=USERNAMES_FILE, max_size=USERNAME_CACHE_SIZE):
+        self.path = path
+        self.max_size = max_size
+        self._entries = OrderedDict()  # { user_id: (username or None, expires_at) }
+        self._lock = threading.Lock()
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def _load(self):
+        now = time.time()
+        for user_id, (username, expires_at) in dm.load_json(self.path, {}).items():
+            if expires_at > now:
+                self._entries[user_id] = (username, expires_at)
+
+    def lookup(self, user_id):
+        """Returns (found, username). A cached failure is (True, None)."""
+        user_id = str(user_id)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[1] <= time.time():
+                if entry is not None:
+                    del self._entries[user_id]
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return True, entry[0]
+
+    def peek(self, user_id):
+        """Returns the cached username without touching LRU order or counters."""
+        entry = self._entries.get(str(user_id))
+        return entry[0] if entry else None
+
+    def put(self, user_id, username):
+        """Caches a username, or a failed lookup if username is None."""
+        ttl = USERNAME_TTL if username else USERNAME_NEGATIVE_TTL
+        with self._lock:
+            self._entries[str(user_id)] = (username, time.time() + ttl)
+            self._entries.move_to_end(str(user_id))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            self._dirty = True
+
+    def missing(self, user_ids):
+        """Returns the IDs (deduplicated, in order) that have no live cache entry."""
+        now = time.time()
+        missing = []
+        for user_id in dict.fromkeys(str(uid) for uid in user_ids):
+            entry = self._entries.get(user_id)
+            if entry is None or entry[1] <= now:
+                missing.append(user_id)
+        return missing
+
+    def prefetch(self, user_ids, fetch):
+        """
+        Resolves every uncached ID concurrently with `fetch(user_id)`, which returns a
+        username or None. Returns the number of IDs that were looked up.
+        """
+        missing = self.missing(user_ids)
+        if not missing:
+            return 0
+        workers = min(USERNAME_PREFETCH_WORKERS, len(missing))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="username") as pool:
+            for user_id, username in zip(missing, pool.map(fetch, missing)):
+                self.put(user_id, username)
+        return len(missing)
+
+    def save(self):
+        """Writes the cache to disk if it changed since the last save."""
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {user_id: [username, expires_at] for user_id, (username, expires_at) in self._entries.items()}
+            self._dirty = False
+        dm.save_json(self.path, data)